@@ -24,4 +24,8 @@ __copyright__ = 'Copyright 2019 Ed Beard, All rights reserved.'
 log = logging.getLogger(__name__)
 log.addHandler(logging.NullHandler())
 
-from .extract import extract_image, extract_images, extract_document, extract_documents
+from .extract import extract_image, extract_images, extract_document, extract_documents, iter_extract_images, \
+    iter_extract_documents
+from .cache import ResultCache
+from .journal import Journal
+from .timing import StageTimer
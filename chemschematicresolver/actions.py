@@ -18,33 +18,40 @@ import logging
 
 import numpy as np
 import os
-from skimage.util import pad
-from skimage.measure import regionprops
+from skimage.measure import regionprops, block_reduce
 
+import bisect
 import itertools
-import copy
 from scipy import ndimage as ndi
-from sklearn.cluster import KMeans
+from scipy.optimize import linear_sum_assignment
 import osra_rgroup
 
-from .model import Panel, Diagram, Label, Rect, Figure
-from .io import imsave, imdel
+from .model import Panel, Diagram, Label, Rect, RectArray, Figure
+from .io import imsave, imsave_temp, imdel
 from .clean import find_repeating_unit, clean_output
-from .utils import crop, skeletonize, binarize, binary_close, binary_floodfill, merge_rect, merge_overlap
+from .utils import crop, skeletonize, binarize, binary_close, binary_floodfill, merge_rect, \
+    summed_area_table, region_sum, pad_white, white
 
 # Standard path to superatom dictionary file
 parent_dir = os.path.dirname(os.path.abspath(__file__))
 superatom_file = os.path.join(parent_dir, 'dict', 'superatom.txt')
 spelling_file = os.path.join(parent_dir, 'dict', 'spelling.txt')
 
+# Cost factor for pairing a diagram with a label away from the most common label direction, in assignment labelling
+COMPASS_PENALTY = 2
+
 
 log = logging.getLogger(__name__)
 
 
-def segment(fig):
+def segment(fig, pixel_budget=None):
     """ Segments image.
 
     :param fig: Input Figure
+    :param pixel_budget: Maximum number of pixels to segment at. For larger figures, closing, floodfill and tagging
+                         run on a downscaled copy, and the panels are mapped back to full resolution. Binarization and
+                         the skeleton used to choose the kernel stay at full resolution, as classification reuses the
+                         skeleton (optional)
     :return panels: List of segmented Panel objects
     """
 
@@ -58,69 +65,122 @@ def segment(fig):
     # Choose kernel size according to skeletonized pixel ratio
     if skel_pixel_ratio > 0.025:
         kernel = 4
-        closed_fig = binary_close(bin_fig, size=kernel)
-        log.debug("Segmentation kernel size = %s" % kernel)
-
     elif 0.02 < skel_pixel_ratio <= 0.025:
         kernel = 6
-        closed_fig = binary_close(bin_fig, size=kernel)
-        log.debug("Segmentation kernel size = %s" % kernel)
-
     elif 0.015 < skel_pixel_ratio <= 0.02:
         kernel = 10
-        closed_fig = binary_close(bin_fig, size=kernel)
-        log.debug("Segmentation kernel size = %s" % kernel)
-
     else:
         kernel = 15
+    log.debug("Segmentation kernel size = %s" % kernel)
+
+    if pixel_budget is not None and bin_fig.img.size > pixel_budget:
+        factor = int(np.ceil(np.sqrt(bin_fig.img.size / pixel_budget)))
+        panels, tag_img = segment_downscaled(bin_fig, kernel, factor)
+    else:
+        factor = 1
         closed_fig = binary_close(bin_fig, size=kernel)
-        log.debug("Segmentation kernel size = %s" % kernel)
 
-    # Using a binary floodfill to identify panel regions
+        # Using a binary floodfill to identify panel regions
+        fill_img = binary_floodfill(closed_fig)
+        tag_img = binary_tag(fill_img)
+        panels = get_bounding_box(tag_img)
+
+    # Keep the panel regions, so diagrams can be cleaned without segmenting them again
+    fig.panel_tags = tag_img.img
+    fig.panel_tags_scale = factor
+
+    return remove_noise_panels(panels, bbox)
+
+
+def remove_noise_panels(panels, bbox):
+    """ Removes relatively tiny pixel islands that are determined to be noise
+
+    :param panels: List of Panel objects
+    :param bbox: Bounding box of the segmented image
+    :return panels: List of Panel objects
+    """
+
+    area_threshold = bbox.area / 200
+    width_threshold = bbox.width / 150
+    return [panel for panel in panels if panel.area > area_threshold or panel.width > width_threshold]
+
+
+def segment_downscaled(bin_fig, kernel, factor):
+    """ Segments a binary image at reduced resolution, returning panels in full resolution co-ordinates.
+
+    The image is reduced by taking the maximum of each factor x factor block, so thin lines are preserved. Closing,
+    floodfill and tagging run on the reduced image with a proportionally smaller kernel. Each panel is then mapped
+    back to full resolution and refined to the tight bounding box of the 'on' pixels it contains.
+
+    :param bin_fig: Binary Figure at full resolution
+    :param kernel: Closing kernel size at full resolution
+    :param factor: Integer downscaling factor
+    :return panels: List of Panel objects in full resolution co-ordinates
+    :return tag_img: Figure of the tagged panel regions at reduced resolution
+    """
+
+    binary = bin_fig.img
+    height, width = binary.shape
+    log.debug('Segmenting at 1/%s resolution' % factor)
+
+    small_fig = Figure(block_reduce(binary, (factor, factor), np.max))
+    closed_fig = binary_close(small_fig, size=max(1, int(round(kernel / factor))))
     fill_img = binary_floodfill(closed_fig)
     tag_img = binary_tag(fill_img)
-    panels = get_bounding_box(tag_img)
 
-    # Removing relatively tiny pixel islands that are determined to be noise
-    area_threshold = fig.get_bounding_box().area / 200
-    width_threshold = fig.get_bounding_box().width / 150
-    panels = [panel for panel in panels if panel.area > area_threshold or panel.width > width_threshold]
-    return panels
+    panels = []
+    for small_panel in get_bounding_box(tag_img):
+        left, right = small_panel.left * factor, min(width, small_panel.right * factor)
+        top, bottom = small_panel.top * factor, min(height, small_panel.bottom * factor)
+
+        # Refine to the extent of the full resolution pixels
+        region = binary[top:bottom, left:right]
+        rows = np.where(np.any(region, axis=1))[0]
+        cols = np.where(np.any(region, axis=0))[0]
+        if len(rows) == 0:
+            continue
+        panels.append(Panel(left + cols[0], left + cols[-1] + 1, top + rows[0], top + rows[-1] + 1, small_panel.tag))
+
+    return panels, tag_img
 
 
-def classify_kmeans(panels, fig, skel=True):
+def classify_kmeans(panels, fig, skel=True, method='exact'):
     """Takes input image and classifies through k means cluster of the panel area"""
 
     if len(panels) <= 1:
         raise Exception('Only one panel detected. Cannot cluster')
-    return get_labels_and_diagrams_k_means_clustering(panels, fig, skel)
+    return get_labels_and_diagrams_k_means_clustering(panels, fig, skel, method)
 
 
-def get_labels_and_diagrams_k_means_clustering(panels, fig, skel=True):
+def get_labels_and_diagrams_k_means_clustering(panels, fig, skel=True, method='exact'):
     """ Splits into labels and diagrams using K-means clustering by the skeletonized area ratio or panel height.
 
     :param panels: List of Panel objects to be clustered
     :param fig: Input Figure
     :param skel: Boolean indication the clustering parameters to use
+    :param method: String indicating the clustering method. 'exact' finds the optimal 2-means split of the single
+                   clustering parameter deterministically, 'kmeans' uses sklearn.cluster.KMeans
     :return Lists of Labels and Diagrams after clustering
     """
 
-    cluster_params = []
-
-    for panel in panels:
-        if skel:
-            cluster_params.append([skeletonize_area_ratio(fig, panel)])
-        else:
-            cluster_params.append([panel.height])
+    if skel:
+        cluster_params = [[ratio] for ratio in skeletonize_area_ratios(fig, panels)]
+    else:
+        cluster_params = [[panel.height] for panel in panels]
 
     all_params = np.array(cluster_params)
 
-    km = KMeans(n_clusters=2)
-    clusters = km.fit(all_params)
+    if method == 'exact':
+        cluster_labels = two_means_1d(all_params[:, 0])
+    elif method == 'kmeans':
+        from sklearn.cluster import KMeans
+        cluster_labels = KMeans(n_clusters=2).fit(all_params).labels_
+    else:
+        raise ValueError('Unknown clustering method %s' % method)
 
     group_1, group_2 = [], []
 
-    for i, cluster in enumerate(clusters.labels_):
+    for i, cluster in enumerate(cluster_labels):
         if cluster == 0:
             group_1.append(panels[i])
         else:
@@ -139,6 +199,45 @@ def get_labels_and_diagrams_k_means_clustering(panels, fig, skel=True):
     return labels, diags
 
 
+def two_means_1d(values):
+    """ Finds the optimal split of one-dimensional data into two clusters (exact 2-means).
+
+    For 1D data the clusters of an optimal 2-means solution are contiguous once the data are sorted, so every split
+    point of the sorted values is scored by its within-cluster sum of squares and the best is chosen. The result is
+    deterministic, with ties resolved towards the lowest split point.
+
+    :param values: 1D array of values to cluster
+    :return: Array of cluster labels, 0 for the lower cluster and 1 for the upper cluster
+    :rtype: numpy.ndarray
+    """
+
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    cluster_labels = np.zeros(n, dtype=int)
+
+    order = np.argsort(values, kind='mergesort')
+    sorted_values = values[order]
+
+    # All values identical (or too few to split): a single cluster
+    if n < 2 or sorted_values[0] == sorted_values[-1]:
+        return cluster_labels
+
+    # Sum of squares of the lower (first k values) and upper clusters for every split point k
+    k = np.arange(1, n)
+    cumsum = np.cumsum(sorted_values)
+    cumsum_sq = np.cumsum(sorted_values ** 2)
+    lower_sse = cumsum_sq[:-1] - cumsum[:-1] ** 2 / k
+    upper_sse = (cumsum_sq[-1] - cumsum_sq[:-1]) - (cumsum[-1] - cumsum[:-1]) ** 2 / (n - k)
+    sse = lower_sse + upper_sse
+
+    # Only split between distinct values
+    sse[sorted_values[1:] == sorted_values[:-1]] = np.inf
+
+    split = k[np.argmin(sse)]
+    cluster_labels[order[split:]] = 1
+    return cluster_labels
+
+
 def preprocessing(labels, diags, fig):
     """Pre-processing steps before final K-means classification
     :param labels: List of Label objects
@@ -168,20 +267,28 @@ def preprocessing(labels, diags, fig):
     return out_labels, out_diags
 
 
-def label_diags(labels, diags, fig_bbox):
+def label_diags(labels, diags, fig_bbox, method='greedy'):
     """ Pair all Diagrams to Labels.
 
     :param labels: List of Label objects
     :param diags: List of Diagram objects
     :param fig_bbox: Co-ordinates of the bounding box of the entire figure
+    :param method: String indicating the pairing method. 'greedy' gives each diagram its nearest label, then resolves
+                   duplicates by expanding in the most common compass direction. 'assignment' pairs all diagrams and
+                   labels at once, minimising the total cost (see assign_labels_optimally)
 
     :returns: List of Diagrams with assigned Labels
 
     """
 
+    if method == 'assignment':
+        return assign_labels_optimally(labels, diags, fig_bbox)
+    elif method != 'greedy':
+        raise ValueError('Unknown labelling method %s' % method)
+
     # Sort diagrams from largest to smallest
     diags.sort(key=lambda x: x.area, reverse=True)
-    initial_sorting = [assign_label_to_diag(diag, labels, fig_bbox) for diag in diags]
+    initial_sorting = assign_labels_to_diags(diags, labels, fig_bbox)
 
     # Identify failures by the presence of duplicate labels
     failed_diag_label = get_duplicate_labelling(initial_sorting)
@@ -194,7 +301,7 @@ def label_diags(labels, diags, fig_bbox):
 
     # Where no sucessful pairings found, attempt looking 'South' for all diagrams (most common relative label position)
     if len(successful_diag_label) == 0:
-        altered_sorting = [assign_label_to_diag_postprocessing(diag, labels, 'S', fig_bbox) for diag in failed_diag_label]
+        altered_sorting = assign_labels_to_diags_postprocessing(list(failed_diag_label), labels, 'S', fig_bbox)
         if len(get_duplicate_labelling(altered_sorting)) != 0:
             altered_sorting = initial_sorting
             pass
@@ -206,7 +313,8 @@ def label_diags(labels, diags, fig_bbox):
         mode_compass = max(diag_compass, key=diag_compass.count)
 
         # Expand outwards in compass direction for all failures
-        altered_sorting = [assign_label_to_diag_postprocessing(diag, labels, mode_compass, fig_bbox) for diag in failed_diag_label]
+        altered_sorting = assign_labels_to_diags_postprocessing(list(failed_diag_label), labels, mode_compass,
+                                                                fig_bbox)
 
         # Check for duplicates after relabelling
         failed_diag_label = get_duplicate_labelling(altered_sorting + successful_diag_label)
@@ -225,8 +333,62 @@ def label_diags(labels, diags, fig_bbox):
     return diags_with_labels + successful_diag_label
 
 
+def assign_labels_optimally(labels, diags, fig_bbox):
+    """ Pairs diagrams and labels by solving a linear assignment problem
+
+    The cost of each pairing is the number of expansions the diagram needs to reach the label (see
+    assign_labels_to_diags). It is multiplied by COMPASS_PENALTY when the label does not lie in the most common compass
+    direction of each diagram's nearest label. Pairings that cannot be reached within the figure are not allowed, and
+    each label is assigned to at most one diagram.
+
+    :param labels: List of Label objects
+    :param diags: List of Diagram objects
+    :param fig_bbox: Panel object representing the co-ordinates for the entire Figure
+
+    :returns: List of Diagrams with assigned Labels
+    """
+
+    # Sort diagrams from largest to smallest
+    diags.sort(key=lambda x: x.area, reverse=True)
+
+    if not diags or not labels:
+        return []
+
+    diag_array = RectArray.from_rects(diags)
+    label_array = RectArray.from_rects(labels)
+    steps = diag_array.expansions(label_array)
+    steps[~expansion_in_figure(diag_array, steps, fig_bbox)] = np.inf
+    compass = diag_array.compass(label_array)
+
+    # Find average position of the nearest label relative to each diagram (denoted with compass points: NSEW)
+    reachable = np.isfinite(steps).any(axis=1)
+    nearest = np.argmin(steps, axis=1)
+    nearest_compass = [compass[i, j] for i, j in enumerate(nearest) if reachable[i] and compass[i, j] is not None]
+
+    cost = steps.copy()
+    if nearest_compass:
+        mode_compass = max(nearest_compass, key=nearest_compass.count)
+        cost[compass != mode_compass] *= COMPASS_PENALTY
+
+    allowed = np.isfinite(cost)
+    if not allowed.any():
+        return []
+
+    # Disallowed pairings cost more than all allowed pairings together, so as many diagrams as possible are labelled
+    cost[~allowed] = cost[allowed].sum() + 1
+    diag_indices, label_indices = linear_sum_assignment(cost)
+
+    labelled_diags = []
+    for i, j in zip(diag_indices, label_indices):
+        if allowed[i, j]:
+            diags[i].label = labels[j]
+            labelled_diags.append(diags[i])
+
+    return labelled_diags
+
+
 def assign_label_to_diag(diag, labels, fig_bbox, rate=1):
-    """ Iteratively expands the bounding box of diagram until it intersects a Label object
+    """ Expands the bounding box of diagram until it intersects a Label object
 
     :param diag: Input Diagram object to expand from
     :param labels: List of Label objects
@@ -235,28 +397,62 @@ def assign_label_to_diag(diag, labels, fig_bbox, rate=1):
 
     :return diag: Diagram with Label object assigned
     """
+    return assign_labels_to_diags([diag], labels, fig_bbox, rate)[0]
+
+
+def assign_labels_to_diags(diags, labels, fig_bbox, rate=1):
+    """ Assigns the nearest Label to each diagram, as found by expanding its bounding box on every side
+
+    The number of expansions needed to reach each label is computed directly from the gaps between the bounding boxes,
+    so every diagram is paired in a single pass. Where several labels are reached on the same expansion, the last is
+    assigned. Diagrams that reach no label before spanning the figure keep their current label.
+
+    :param diags: List of Diagram objects
+    :param labels: List of Label objects
+    :param fig_bbox: Panel object representing the co-ordinates for the entire Figure
+    :param rate: Number of pixels to expand by upon each iteration
+
+    :return diags: List of Diagrams with Label objects assigned
+    """
+
+    if not diags or not labels:
+        return diags
+
+    diag_array = RectArray.from_rects(diags)
+    steps = diag_array.expansions(RectArray.from_rects(labels), rate)
 
-    probe_rect = Rect(diag.left, diag.right, diag.top, diag.bottom)
-    found = False
-    max_threshold_width = fig_bbox.width
-    max_threshold_height = fig_bbox.height
+    # Index of the last label with the fewest expansions
+    nearest = steps.shape[1] - 1 - np.argmin(steps[:, ::-1], axis=1)
+    nearest_steps = steps[np.arange(len(diags)), nearest]
+    found = expansion_in_figure(diag_array, nearest_steps, fig_bbox, rate)
 
-    while found is False and (probe_rect.width < max_threshold_width or probe_rect.height < max_threshold_height):
-        # Increase border value each loop
-        probe_rect.right = probe_rect.right + rate
-        probe_rect.bottom = probe_rect.bottom + rate
-        probe_rect.left = probe_rect.left - rate
-        probe_rect.top = probe_rect.top - rate
+    for i in np.flatnonzero(found):
+        diags[i].label = labels[nearest[i]]
+    return diags
 
-        for label in labels:
-            if probe_rect.overlaps(label):
-                found = True
-                diag.label = label
-    return diag
+
+def expansion_in_figure(diag_array, steps, fig_bbox, rate=1):
+    """ Returns whether each diagram is still narrower or shorter than the figure before its final expansion
+
+    :param diag_array: RectArray of diagrams
+    :param steps: Number of expansions made by each diagram, or a matrix with a row of expansions for each diagram
+    :param fig_bbox: Panel object representing the co-ordinates for the entire Figure
+    :param rate: Number of pixels to expand by upon each iteration
+
+    :return: Boolean array, the same shape as steps
+    """
+
+    width, height = diag_array.width, diag_array.height
+    if np.ndim(steps) == 2:
+        width, height = width[:, np.newaxis], height[:, np.newaxis]
+
+    growth = 2 * rate * (steps - 1)
+    with np.errstate(invalid='ignore'):
+        return (width + growth < fig_bbox.width) | (height + growth < fig_bbox.height)
 
 
 def assign_label_to_diag_postprocessing(diag, labels, direction, fig_bbox, rate=1):
-    """ Iteratively expands the bounding box of diagram in the specified compass direction
+    """ Expands the bounding box of diagram in the specified compass direction until it intersects a Label object
 
     :param diag: Input Diagram object to expand from
     :param labels: List of Label objects
@@ -264,46 +460,51 @@ def assign_label_to_diag_postprocessing(diag, labels, direction, fig_bbox, rate=
     :param fig_bbox: Panel object representing the co-ordinates for the entire Figure
     :param rate: Number of pixels to expand by upon each iteration
     """
+    return assign_labels_to_diags_postprocessing([diag], labels, direction, fig_bbox, rate)[0]
 
-    probe_rect = Rect(diag.left, diag.right, diag.top, diag.bottom)
-    found = False
 
-    def label_loop():
+def assign_labels_to_diags_postprocessing(diags, labels, direction, fig_bbox, rate=1):
+    """ Assigns the nearest Label lying in the specified compass direction to each diagram
 
-        for label in labels:
-            # Only accepting labels in the average direction
-            if diag.compass_position(label) != direction:
-                pass
-            elif probe_rect.overlaps(label):
-                diag.label = label
-                return True
+    Only the edge of each diagram facing that direction is expanded, until it reaches the edge of the figure. Where
+    several labels are reached on the same expansion, the first is assigned.
 
-        return False
+    :param diags: List of Diagram objects
+    :param labels: List of Label objects
+    :param direction: String representing determined compass direction (allowed values: 'E', 'S', 'W', 'N')
+    :param fig_bbox: Panel object representing the co-ordinates for the entire Figure
+    :param rate: Number of pixels to expand by upon each iteration
 
-    # Increase border value each loop
-    if direction == 'E':
-        while found is False and probe_rect.right < fig_bbox.right:
-            probe_rect.right = probe_rect.right + rate
-            found = label_loop()
+    :return diags: List of Diagrams with Label objects assigned
+    """
 
-    elif direction == 'S':
-        while found is False and probe_rect.bottom < fig_bbox.bottom:
-            probe_rect.bottom = probe_rect.bottom + rate
-            found = label_loop()
+    if not diags or not labels or direction not in ['E', 'S', 'W', 'N']:
+        return diags
 
-    elif direction == 'W':
-        while found is False and probe_rect.left > fig_bbox.left:
-            probe_rect.left = probe_rect.left - rate
-            found = label_loop()
+    diag_array = RectArray.from_rects(diags)
+    label_array = RectArray.from_rects(labels)
+    steps = diag_array.directional_expansions(label_array, direction, rate)
 
-    elif direction == 'N':
-        while found is False and probe_rect.top > fig_bbox.top:
-            probe_rect.top = probe_rect.top - rate
-            found = label_loop()
-    else:
-        return diag
+    # Only accepting labels in the average direction
+    steps[diag_array.compass(label_array) != direction] = np.inf
 
-    return diag
+    nearest = np.argmin(steps, axis=1)
+    growth = rate * (steps[np.arange(len(diags)), nearest] - 1)
+
+    # The edge must be inside the figure before its final expansion
+    with np.errstate(invalid='ignore'):
+        if direction == 'E':
+            found = diag_array.right + growth < fig_bbox.right
+        elif direction == 'S':
+            found = diag_array.bottom + growth < fig_bbox.bottom
+        elif direction == 'W':
+            found = diag_array.left - growth > fig_bbox.left
+        else:
+            found = diag_array.top - growth > fig_bbox.top
+
+    for i in np.flatnonzero(found):
+        diags[i].label = labels[nearest[i]]
+    return diags
 
 
 def read_diagram_pyosra(diag, extension='jpg', debug=False, superatom_path=superatom_file, spelling_path=spelling_file):
@@ -318,11 +519,10 @@ def read_diagram_pyosra(diag, extension='jpg', debug=False, superatom_path=super
     """
 
     # Add some padding to image to help resolve characters on the edge
-    padded_img = pad(diag.fig.img, ((5, 5), (5, 5), (0, 0)), mode='constant', constant_values=1)
+    padded_img = pad_white(diag.fig.img, 5)
 
     # Save a temp image
-    temp_img_fname = 'osra_temp.' + extension
-    imsave(temp_img_fname, padded_img)
+    temp_img_fname = imsave_temp(padded_img, extension, prefix='osra_temp_')
 
     # Run osra on temp image
     smile = osra_rgroup.read_diagram(temp_img_fname, debug=debug, superatom_file=superatom_path, spelling_file=spelling_path)
@@ -332,6 +532,8 @@ def read_diagram_pyosra(diag, extension='jpg', debug=False, superatom_path=super
 
     if not debug:
         imdel(temp_img_fname)
+    else:
+        log.debug('Kept OSRA input image %s' % temp_img_fname)
 
     smile = clean_output(smile)
     return smile
@@ -340,6 +542,8 @@ def read_diagram_pyosra(diag, extension='jpg', debug=False, superatom_path=super
 def remove_diag_pixel_islands(diags, fig):
     """ Removes small pixel islands from the diagram
 
+    The islands are found from the panel regions kept by segment, so the diagram is not segmented again.
+
     :param diags: List of input Diagrams
     :param fig: Figure object
 
@@ -349,12 +553,16 @@ def remove_diag_pixel_islands(diags, fig):
 
     for diag in diags:
 
-        # Make a cleaned copy of image to be used when resolving diagrams
-        clean_fig = copy.deepcopy(fig)
+        diag_fig = fig.view(diag.left, diag.right, diag.top, diag.bottom)
+
+        if fig.panel_tags is None:
+            sub_panels = segment(fig.view(diag.left, diag.right, diag.top, diag.bottom))
+        else:
+            sub_panels = remove_noise_panels(get_sub_panels(fig, diag), diag_fig.get_bounding_box())
 
-        diag_fig = Figure(crop(clean_fig.img, diag.left, diag.right, diag.top, diag.bottom))
-        seg_fig = Figure(crop(clean_fig.img, diag.left, diag.right, diag.top, diag.bottom))
-        sub_panels = segment(seg_fig)
+        if not sub_panels:
+            diag.fig = diag_fig
+            continue
 
         panel_areas = [panel.area for panel in sub_panels]
         diag_area = max(panel_areas)
@@ -363,14 +571,53 @@ def remove_diag_pixel_islands(diags, fig):
 
         sub_bbox = [(panel.left, panel.right, panel.top, panel.bottom) for panel in sub_panels]
 
+        # Only copy the diagram when there are islands to blank
+        if sub_bbox:
+            diag_fig = diag_fig.copy()
+
         for bbox in sub_bbox:
-            diag_fig.img[bbox[2]:bbox[3], bbox[0]:bbox[1]] = np.ones(3)
+            diag_fig.img[bbox[2]:bbox[3], bbox[0]:bbox[1]] = white(diag_fig.img)
 
         diag.fig = diag_fig
 
     return diags
 
 
+def get_sub_panels(fig, rect):
+    """ Returns the pixel islands inside a rectangle, from the panel regions found by segment
+
+    Each connected part of a panel region inside the rectangle is an island. Its bounding box is fitted to the 'on'
+    pixels it contains, in co-ordinates relative to the rectangle.
+
+    :param fig: Segmented Figure
+    :param rect: Rect to find pixel islands in
+    :return sub_panels: List of Panel objects
+    """
+
+    left, right = max(0, rect.left), min(fig.img.shape[1], rect.right)
+    top, bottom = max(0, rect.top), min(fig.img.shape[0], rect.bottom)
+    scale = fig.panel_tags_scale
+
+    if scale == 1:
+        tags = crop(fig.panel_tags, left, right, top, bottom)
+    else:
+        # Expand the reduced resolution regions covering the rectangle
+        small_tags = fig.panel_tags[top // scale:(bottom - 1) // scale + 1, left // scale:(right - 1) // scale + 1]
+        tags = np.repeat(np.repeat(small_tags, scale, axis=0), scale, axis=1)
+        tags = tags[top % scale:top % scale + bottom - top, left % scale:left % scale + right - left]
+
+    # Regions with different tags never touch, so parts can be labelled without tags
+    parts, no_parts = ndi.label(tags > 0)
+    parts[~crop(fig.binary, left, right, top, bottom)] = 0
+
+    sub_panels = []
+    for tag, part in enumerate(ndi.find_objects(parts)):
+        if part is not None:
+            rows, cols = part
+            sub_panels.append(Panel(cols.start, cols.stop, rows.start, rows.stop, tag))
+    return sub_panels
+
+
 def pixel_ratio(fig, diag):
     """ Calculates the ratio of 'on' pixels to bounding box area for binary figure
 
@@ -435,6 +682,27 @@ def skeletonize_area_ratio(fig, panel):
     return pixel_ratio(skel_fig, panel)
 
 
+def skeletonize_area_ratios(fig, panels):
+    """ Calculates the ratio of skeletonized image pixels to total number of pixels for many panels
+
+    The figure is skeletonized once, and each panel's ratio is read from a summed-area table of the skeleton in
+    constant time.
+
+    :param fig: Input figure
+    :param panels: List of Panel objects
+    :return: List of Floats : Ratio of skeletonized pixels to total area of each panel (see pixel_ratio)
+    """
+
+    skel_fig = skeletonize(fig)
+    sat = summed_area_table(skel_fig.img.astype(bool))
+
+    ratios = []
+    for panel in panels:
+        ones, all_pixels = region_sum(sat, panel.left, panel.right, panel.top, panel.bottom)
+        ratios.append(ones / all_pixels)
+    return ratios
+
+
 def order_by_area(panels):
     """ Returns a list of panel objects ordered by area.
 
@@ -493,10 +761,15 @@ def merge_loop_horizontal(panels, fig_input):
     """
 
     output_panels = []
-    blacklisted_panels = []
+    blacklisted_panels = set()
     done = True
 
-    for a, b in itertools.combinations(panels, 2):
+    # Only pairs where one panel starts within reach of the right edge of the other can pass the distance check
+    candidate_pairs = get_candidate_pairs(panels, lambda panel: panel.left,
+                                          lambda panel: (panel.right, panel.right + 2 * panel.height))
+
+    for i, j in candidate_pairs:
+        a, b = panels[i], panels[j]
 
         # Check panels lie in roughly the same line, that they are of label size and similar height
         if abs(a.center[1] - b.center[1]) < 1.5 * a.height \
@@ -508,7 +781,7 @@ def merge_loop_horizontal(panels, fig_input):
                 merged_rect = merge_rect(a, b)
                 merged_panel = Panel(merged_rect.left, merged_rect.right, merged_rect.top, merged_rect.bottom, 0)
                 output_panels.append(merged_panel)
-                blacklisted_panels.extend([a, b])
+                blacklisted_panels.update([a, b])
                 done = False
 
     log.debug('Length of blacklisted : %s' % len(blacklisted_panels))
@@ -534,10 +807,16 @@ def merge_loop_vertical(panels):
     """
 
     output_panels = []
-    blacklisted_panels = []
+    blacklisted_panels = set()
+
+    # Only pairs with vertical centers within reach of each other can pass the distance checks
+    candidate_pairs = get_candidate_pairs(panels, lambda panel: panel.center[1],
+                                          lambda panel: (panel.center[1] - 3 * panel.height,
+                                                         panel.center[1] + 3 * panel.height))
 
     # Merging labels that are in close proximity vertically
-    for a, b in itertools.combinations(panels, 2):
+    for i, j in candidate_pairs:
+        a, b = panels[i], panels[j]
 
         if (abs(a.left - b.left) < 3 * min(a.height, b.height) or abs(a.center[0] - b.center[0]) < 3 * min(a.height, b.height)) \
                 and abs(a.center[1] - b.center[1]) < 3 * min(a.height, b.height) \
@@ -546,7 +825,7 @@ def merge_loop_vertical(panels):
             merged_rect = merge_rect(a, b)
             merged_panel = Panel(merged_rect.left, merged_rect.right, merged_rect.top, merged_rect.bottom, 0)
             output_panels.append(merged_panel)
-            blacklisted_panels.extend([a, b])
+            blacklisted_panels.update([a, b])
 
     for panel in panels:
         if panel not in blacklisted_panels:
@@ -557,27 +836,31 @@ def merge_loop_vertical(panels):
     return output_panels
 
 
-def get_one_to_merge(all_combos, panels):
-    """Merges the first overlapping set of panels found and an returns updated panel list
+def get_candidate_pairs(panels, key, reach):
+    """ Returns the index pairs of panels that are near enough to each other to be merged
 
-    :param all_combos: List of Tuple(Panel, Panel) objects of all possible combinations of the input 'panels' variable
-    :param panels: List of input Panels
+    Panels are sorted by key, and for each panel a binary search finds the panels with a key within its reach. This
+    avoids testing every combination of panels. Every pair with one panel's key in the reach of the other is returned,
+    ordered as in itertools.combinations.
 
-    :return panels: List of updated panels after one overlap is merged
-    :return: Bool indicated whether all overlaps have been completed
+    :param panels: List of Panels
+    :param key: Function returning the sort key of a Panel
+    :param reach: Function returning the (lowest, highest) key of the Panels near to a Panel
+    :return: List of Tuple(int, int) index pairs (i < j) into panels
     """
 
-    for a, b in all_combos:
+    order = sorted(range(len(panels)), key=lambda i: key(panels[i]))
+    keys = [key(panels[i]) for i in order]
 
-        overlap_panel = merge_overlap(a, b)
-        if overlap_panel is not None:
-            merged_panel = Panel(overlap_panel.left, overlap_panel.right, overlap_panel.top, overlap_panel.bottom, 0)
-            panels.remove(a)
-            panels.remove(b)
-            panels.append(merged_panel)
-            return panels, False
+    pairs = set()
+    for i, panel in enumerate(panels):
+        low, high = reach(panel)
+        for k in range(bisect.bisect_left(keys, low), bisect.bisect_right(keys, high)):
+            j = order[k]
+            if j != i:
+                pairs.add((min(i, j), max(i, j)))
 
-    return panels, True
+    return sorted(pairs)
 
 
 def convert_panels_to_labels(panels):
@@ -593,19 +876,75 @@ def convert_panels_to_labels(panels):
 def merge_all_overlaps(panels):
     """ Merges all overlapping rectangles together
 
+    Overlapping panels are grouped with a union-find, and the groups are merged. As a merged panel can overlap panels
+    that none of its members did, this is repeated on the merged panels until no panels overlap.
+
+    Panels that are not merged keep their order, and are followed by the merged panels in order of their first member.
+
     :param panels : Input list of Panels
     :return output_panels: List of merged panels
     :return all_merged: Bool indicating whether all merges are completed
     """
 
-    all_merged = False
+    # Indices of the input panels in each group, and the bounding box of each group
+    members = [[i] for i in range(len(panels))]
+    boxes = list(panels)
+
+    while True:
+        roots = get_overlap_roots(boxes)
+        if all(root == i for i, root in enumerate(roots)):
+            break
+
+        # Roots are the lowest index in each group, so groups stay ordered by their first member
+        merged_members, merged_boxes, group_index = [], [], {}
+        for i, root in enumerate(roots):
+            if root == i:
+                group_index[root] = len(merged_members)
+                merged_members.append(list(members[i]))
+                merged_boxes.append(boxes[i])
+            else:
+                k = group_index[root]
+                merged_members[k].extend(members[i])
+                merged_boxes[k] = merge_rect(merged_boxes[k], boxes[i])
+        members, boxes = merged_members, merged_boxes
+
+    untouched_panels = [panels[group[0]] for group in members if len(group) == 1]
+    merged_panels = [Panel(box.left, box.right, box.top, box.bottom, 0)
+                     for group, box in zip(members, boxes) if len(group) > 1]
+
+    output_panels = retag_panels(untouched_panels + merged_panels)
+    return output_panels, True
+
+
+def get_overlap_roots(rects):
+    """ Groups overlapping rectangles with a union-find
+
+    Rectangles are swept in order of their left edge, and each is only compared with the earlier rectangles whose
+    right edge it has not passed.
+
+    :param rects: List of Rects
+    :return roots: List of the group of each Rect, identified by the lowest index in the group
+    """
+
+    parents = list(range(len(rects)))
 
-    while all_merged is False:
-        all_combos = list(itertools.combinations(panels, 2))
-        panels, all_merged = get_one_to_merge(all_combos, panels)
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
 
-    output_panels = retag_panels(panels)
-    return output_panels, all_merged
+    active = []
+    for i in sorted(range(len(rects)), key=lambda i: rects[i].left):
+        rect = rects[i]
+        active = [j for j in active if rects[j].right > rect.left]
+        for j in active:
+            if rect.overlaps(rects[j]):
+                root_i, root_j = find(i), find(j)
+                parents[max(root_i, root_j)] = min(root_i, root_j)
+        active.append(i)
+
+    return [find(i) for i in range(len(rects))]
 
 
 def get_duplicate_labelling(labelled_diags):
@@ -655,28 +994,11 @@ def remove_duplicates(diags, fig_bbox, rate=1):
             output_diags.append(diags_with_this_label[0])
             continue
 
-        diag_and_displacement = [] # List of diag-distance tuples
-
-        for diag in diags_with_this_label:
-
-            probe_rect = Rect(diag.left, diag.right, diag.top, diag.bottom)
-            found = False
-            max_threshold_width = fig_bbox.width
-            max_threshold_height = fig_bbox.height
-            rate_counter = 0
-
-            while found is False and (probe_rect.width < max_threshold_width or probe_rect.height < max_threshold_height):
-                # Increase border value each loop
-                probe_rect.right = probe_rect.right + rate
-                probe_rect.bottom = probe_rect.bottom + rate
-                probe_rect.left = probe_rect.left - rate
-                probe_rect.top = probe_rect.top - rate
-
-                rate_counter += rate
-
-                if probe_rect.overlaps(label):
-                    found = True
-                    diag_and_displacement.append((diag, rate_counter))
+        # Displacement of each diagram's bounding box when it first reaches the label
+        diag_array = RectArray.from_rects(diags_with_this_label)
+        steps = diag_array.expansions(RectArray.from_rects([label]), rate)[:, 0]
+        found = expansion_in_figure(diag_array, steps, fig_bbox, rate)
+        diag_and_displacement = [(diag, steps[i] * rate) for i, diag in enumerate(diags_with_this_label) if found[i]]
 
         master_diag = min(diag_and_displacement, key=lambda x: x[1])[0]
         output_diags.append(master_diag)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+Cache
+=====
+
+Content-addressed on-disk cache of extraction results.
+
+author: Ed Beard
+email: ejb207@cam.ac.uk
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import hashlib
+import json
+import os
+
+from . import __version__
+from .actions import superatom_file, spelling_file
+
+log = logging.getLogger(__name__)
+
+
+class ResultCache(object):
+    """ Caches the output of extract_image on disk, keyed by the content of the input image.
+
+    Keys also include every setting that can change the output (allow_wildcards, the package version and the
+    superatom and spelling dictionaries), so stale results are never returned. Negative results (empty outputs) are
+    cached too. Entries are evicted least recently used first when the cache grows beyond max_size.
+
+    Several processes can share one cache directory. Each one tracks the size of the cache from its own writes only,
+    so the size that triggers eviction is approximate. Eviction itself recomputes the size from the entries on disk.
+    """
+
+    def __init__(self, path, max_size=2 ** 30, superatom_path=superatom_file, spelling_path=spelling_file):
+        """
+
+        :param string path: Directory used to store the cache entries.
+        :param int max_size: Maximum total size of the cache entries in bytes.
+        :param string superatom_path: Path to the superatom dictionary used for extraction.
+        :param string spelling_path: Path to the spelling dictionary used for extraction.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.superatom_path = superatom_path
+        self.spelling_path = spelling_path
+        self._size = None
+        self._dict_digests = {}
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def key(self, img_bytes, allow_wildcards=False, **settings):
+        """ Returns the cache key of an input image.
+
+        :param bytes img_bytes: Raw bytes of the input image file.
+        :param bool allow_wildcards: Setting used for extraction.
+        :param settings: Other settings used for extraction (eg. dtype). Settings that are None are left out.
+        :return: Hex digest identifying the image and extraction settings.
+        :rtype: string
+        """
+        hasher = hashlib.sha256(img_bytes)
+        hasher.update(('%s:%s' % (__version__, allow_wildcards)).encode('utf-8'))
+        for name in sorted(settings):
+            if settings[name] is not None:
+                hasher.update(('%s:%s' % (name, settings[name])).encode('utf-8'))
+
+        for dict_path in [self.superatom_path, self.spelling_path]:
+            hasher.update(self._dict_digest(dict_path))
+
+        return hasher.hexdigest()
+
+    def _dict_digest(self, dict_path):
+        """ Returns the digest of a dictionary file.
+
+        The superatom file is updated during R-Group resolution, so a dictionary is hashed again whenever its
+        modification time or size changes.
+        """
+        stat = os.stat(dict_path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        if dict_path not in self._dict_digests or self._dict_digests[dict_path][0] != version:
+            with open(dict_path, 'rb') as inf:
+                self._dict_digests[dict_path] = (version, hashlib.sha256(inf.read()).digest())
+
+        return self._dict_digests[dict_path][1]
+
+    def get(self, key):
+        """ Returns the cached output for a key, or None if the key is not in the cache.
+
+        :param string key: Cache key (see ResultCache.key)
+        :return: List of label candidates and smiles
+        :rtype: list[tuple[list[string],string]]
+        """
+        entry_path = self._entry_path(key)
+
+        try:
+            with open(entry_path, 'r') as inf:
+                output = json.load(inf)
+        except (IOError, ValueError):
+            return None
+
+        # Mark entry as recently used
+        os.utime(entry_path, None)
+
+        return [(label_cands, smile) for label_cands, smile in output]
+
+    def set(self, key, output):
+        """ Stores the output for a key, evicting the least recently used entries if the cache is full.
+
+        :param string key: Cache key (see ResultCache.key)
+        :param output: List of label candidates and smiles
+        """
+        entry_path = self._entry_path(key)
+
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        data = json.dumps(output)
+        temp_path = '%s.%s.tmp' % (entry_path, os.getpid())
+        with open(temp_path, 'w') as outf:
+            outf.write(data)
+        os.replace(temp_path, entry_path)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            # Non-ASCII characters are escaped, so the length is the size of the entry in bytes
+            self._size += len(data)
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def size(self):
+        """ Returns the total size of all cache entries in bytes."""
+        return sum(size for mtime, size, entry in self._entry_stats())
+
+    def evict(self):
+        """ Removes least recently used entries until the cache is within max_size.
+
+        The size of the cache is recomputed from the entries on disk, which may have been added or removed by other
+        processes.
+        """
+
+        entry_stats = sorted(self._entry_stats(), key=lambda entry_stat: entry_stat[0])
+        size = sum(size for mtime, size, entry in entry_stats)
+
+        for mtime, entry_size, entry in entry_stats:
+            if size <= self.max_size:
+                break
+            size -= entry_size
+            try:
+                os.remove(entry.path)
+                log.debug('Evicted %s from result cache' % entry.name)
+            except OSError:
+                # Entry already removed by another process
+                pass
+
+        self._size = size
+
+    def clear(self):
+        """ Removes all entries from the cache."""
+        for entry in self._entries():
+            os.remove(entry.path)
+        self._size = 0
+
+    def _entries(self):
+        return [entry for entry in os.scandir(self.path) if entry.name.endswith('.json')]
+
+    def _entry_stats(self):
+        """ Returns the (mtime, size, entry) of each cache entry, skipping entries removed since they were listed."""
+        entry_stats = []
+        for entry in self._entries():
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entry_stats.append((stat.st_mtime, stat.st_size, entry))
+        return entry_stats
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key + '.json')
@@ -10,11 +10,11 @@ email: ejb207@cam.ac.uk
 
 """
 
-import copy
 import numpy as np
 import warnings
 
 from .ocr import read_label, read_diag_text
+from .utils import white
 
 
 def find_repeating_unit(labels, diags, fig):
@@ -59,11 +59,13 @@ def remove_diagram_numbers(diags, fig):
                 num_bbox.append((diag.left + token.left, diag.left + token.right,
                                  diag.top + token.top, diag.top + token.bottom))
 
-    # Make a cleaned copy of image to be used when resolving diagrams
-    diag_fig = copy.deepcopy(fig)
+    # Make a cleaned copy of image to be used when resolving diagrams, only if there are numbers to remove
+    if not num_bbox:
+        return fig
+    diag_fig = fig.copy()
 
     for bbox in num_bbox:
-        diag_fig.img[bbox[2]:bbox[3], bbox[0]:bbox[1]] = np.ones(3)
+        diag_fig.img[bbox[2]:bbox[3], bbox[0]:bbox[1]] = white(diag_fig.img)
 
     return diag_fig
 
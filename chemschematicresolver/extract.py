@@ -18,46 +18,58 @@ import logging
 from .io import imread
 from .actions import segment, classify_kmeans, preprocessing, label_diags, read_diagram_pyosra
 from .clean import clean_output
-from .ocr import read_label
+from .ocr import read_label, warmup, OcrSession
 from .r_group import detect_r_group, get_rgroup_smiles
 from .validate import is_false_positive, remove_repeating
+from .journal import Journal
+from .timing import StageTimer, NULL_TIMER
 
 from matplotlib import pyplot as plt
 import matplotlib.patches as mpatches
 import os
 import urllib
 import math
+import contextlib
+import functools
+import multiprocessing
 import tarfile, zipfile
+from io import BytesIO
 
 from chemdataextractor import Document
+from threadpoolctl import threadpool_limits
 
 log = logging.getLogger(__name__)
 
+# Environment variables limiting the native threads used by each worker process
+THREAD_LIMIT_VARS = ['OMP_NUM_THREADS', 'OMP_THREAD_LIMIT', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
 
-def extract_document(filename, extract_all=True, allow_wildcards=False, output=os.path.join(os.path.dirname(os.getcwd()), 'csd')):
+
+def extract_document(filename, extract_all=True, allow_wildcards=False, output=os.path.join(os.path.dirname(os.getcwd()), 'csd'), timer=None):
     """ Extracts chemical records from a document and identifies chemical schematic diagrams.
     Then substitutes in if the label was found in a record
 
-    :param filename: Location of document to be extracted
+    :param filename: Location of document to be extracted, or a file-like object with a 'name' attribute
     :param extract_all : Boolean to determine whether output is combined with chemical records
     :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
     :param output: Directory to store extracted images
+    :param timer: StageTimer recording the time spent in each stage, accumulated over all figures (optional)
 
     :return : Dictionary of chemical records with diagram SMILES strings, or List of label candidates and smiles
     """
 
-    log.info('Extracting from %s ...' % filename)
+    name = get_input_name(filename)
+    log.info('Extracting from %s ...' % name)
 
     # Extract the raw records from CDE
-    doc = Document.from_file(filename)
+    doc = Document.from_file(filename, fname=name)
     figs = doc.figures
 
     # Identify image candidates
-    csds = find_image_candidates(figs, filename)
+    csds = find_image_candidates(figs, name)
 
     # Download figures locally
     fig_paths = download_figs(csds, output)
-    log.info("All relevant figures from %s downloaded successfully" % filename)
+    log.info("All relevant figures from %s downloaded successfully" % name)
 
     # When diagrams are not found, return results without CSR extraction
     if extract_all and not fig_paths:
@@ -72,7 +84,7 @@ def extract_document(filename, extract_all=True, allow_wildcards=False, output=o
     results = []
     for path in fig_paths:
         try:
-            results.append(extract_image(path, allow_wildcards=allow_wildcards))
+            results.append(extract_image(path, allow_wildcards=allow_wildcards, timer=timer))
         except:
             log.error('Could not extract image at %s' % path)
             pass
@@ -89,13 +101,14 @@ def extract_document(filename, extract_all=True, allow_wildcards=False, output=o
     return combined_results
 
 
-def extract_documents(dirname, extract_all=True, allow_wildcards=False, output=os.path.join(os.path.dirname(os.getcwd()), 'csd')):
+def extract_documents(dirname, extract_all=True, allow_wildcards=False, output=os.path.join(os.path.dirname(os.getcwd()), 'csd'), journal=None):
     """ Automatically identifies and extracts chemical schematic diagrams from all files in a directory of documents.
 
     :param dirname: Location of directory, with corpus to be extracted
     :param extract_all : Boolean indicating whether to extract all results (even those without chemical diagrams)
     :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
     :param output: Directory to store extracted images
+    :param journal: Location of a checkpoint journal file. Documents recorded in the journal are not re-extracted (optional)
 
     :return results: List of chemical record objects, enriched with chemical diagram information
     """
@@ -103,54 +116,67 @@ def extract_documents(dirname, extract_all=True, allow_wildcards=False, output=o
     log.info('Extracting all documents at %s ...' % dirname)
 
     results = []
+    for path, result, error, timings in iter_extract_documents(dirname, extract_all, allow_wildcards, output, journal):
+        if error is not None:
+            raise error
+        results.append(result)
 
-    if os.path.isdir(dirname):
-        # Extract from all files in directory
-        for file in os.listdir(dirname):
-            results.append(extract_document(os.path.join(dirname, file), extract_all, allow_wildcards, output))
+    return results
 
-    elif os.path.isfile(dirname):
 
-        # Unzipping compressed inputs
-        if dirname.endswith('zip'):
-            # Logic to unzip the file locally
-            log.info('Opening zip file...')
-            zip_ref = zipfile.ZipFile(dirname)
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            zip_ref.extractall(extracted_path)
-            zip_ref.close()
-
-        elif dirname.endswith('tar.gz'):
-            # Logic to unzip tarball locally
-            log.info('Opening tarball file...')
-            tar_ref = tarfile.open(dirname, 'r:gz')
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            tar_ref.extractall(extracted_path)
-            tar_ref.close()
-
-        elif dirname.endswith('tar'):
-            # Logic to unzip tarball locally
-            log.info('Opening tarball file...')
-            tar_ref = tarfile.open(dirname, 'r:')
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            tar_ref.extractall(extracted_path)
-            tar_ref.close()
-        else:
-            # Logic for wrong file type
-            log.error('Input not a directory')
-            raise NotADirectoryError
+def iter_extract_documents(dirname, extract_all=True, allow_wildcards=False, output=os.path.join(os.path.dirname(os.getcwd()), 'csd'), journal=None):
+    """ Extracts all documents in a directory, yielding the output of each document as soon as it finishes.
 
-        docs = [os.path.join(extracted_path, doc) for doc in os.listdir(extracted_path)]
-        for file in docs:
-            results.append(extract_document(file, extract_all, allow_wildcards, output))
+    When a journal is given, the output of each successful document is recorded as soon as it finishes. Restarting
+    an interrupted run with the same journal replays the recorded outputs instead of extracting those documents again.
+    The journal records the extraction settings, and a ValueError is raised if it is resumed with different settings.
 
-    return results
+    :param dirname: Location of directory, with corpus to be extracted
+    :param extract_all : Boolean indicating whether to extract all results (even those without chemical diagrams)
+    :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
+    :param output: Directory to store extracted images
+    :param journal: Location of a checkpoint journal file, or a Journal object (optional)
+
+    :return: Generator of (path, results, error, timings) tuples, where error is None if extraction succeeded
+    :rtype: Iterator[tuple[string, list, Exception, dict]]
+    """
+
+    settings = {'extract_all': extract_all, 'allow_wildcards': allow_wildcards}
+    if isinstance(journal, str):
+        journal = Journal(journal, settings)
+    elif journal is not None and journal.settings != settings:
+        raise ValueError('Journal %s was recorded with settings %s, not %s'
+                         % (journal.path, journal.settings, settings))
+
+    for doc in get_inputs(dirname):
+
+        path = get_input_name(doc)
+        if journal is not None and path in journal:
+            log.info('Skipping %s, already completed in journal' % path)
+            yield path, restore_document_results(journal.get(path), extract_all), None, {}
+            continue
+
+        path, results, error, timings = run_timed(extract_document, doc, extract_all, allow_wildcards, output)
+        if journal is not None and error is None:
+            journal.record(path, results)
+
+        yield path, results, error, timings
+
+
+def restore_document_results(results, extract_all=True):
+    """ Restores the types of document results replayed from a journal, which stores them as JSON
+
+    Chemical records are JSON types already. Diagram results are (label candidates, SMILES) tuples, which JSON stores
+    as lists.
+
+    :param results: Results of extract_document, read back from JSON
+    :param extract_all: Boolean to determine whether results are chemical records or diagram results
+    :return: Results as returned by extract_document
+    """
+
+    if extract_all:
+        return results
+    return [[tuple(diag_result) for diag_result in fig_results] for fig_results in results]
 
 
 def substitute_labels(records, results):
@@ -241,43 +267,85 @@ def find_image_candidates(figs, filename):
     return csd_imgs
 
 
-def extract_image(filename, debug=False, allow_wildcards=False):
+def extract_image(filename, debug=False, allow_wildcards=False, cache=None, timer=None, segment_pixel_budget=None,
+                  dtype='float64', max_pixels=None, label_method='greedy', ocr_session=False):
     """ Converts a Figure containing chemical schematic diagrams to SMILES strings and extracted label candidates
 
-    :param filename: Input file name for extraction
+    :param filename: Input file name for extraction, or a file-like object with a 'name' attribute
     :param debug: Bool to indicate debugging
     :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
+    :param cache: ResultCache used to store and look up results for identical images (optional)
+    :param timer: StageTimer recording the time spent in each stage of the extraction (optional)
+    :param segment_pixel_budget: Maximum number of pixels to segment at. For larger figures, the closing and
+                                 floodfill steps of segmentation run on a downscaled copy (see actions.segment).
+                                 Skeletonization, OCR and OSRA still use full resolution (optional)
+    :param dtype: Image data type policy (see io.imread). 'uint8' uses the least memory
+    :param max_pixels: Maximum number of pixels to read the image at. Larger images are downscaled while decoding
+                       (optional)
+    :param label_method: Method used to pair diagrams with labels (see actions.label_diags)
+    :param ocr_session: Bool to indicate whether labels are read from one copy of the image passed to Tesseract (see
+                        ocr.OcrSession). Faster, but Tesseract also sees the pixels around each label, which can change
+                        the text read
 
     :return : List of label candidates and smiles
     :rtype : list[tuple[list[string],string]]
     """
 
+    if timer is None:
+        timer = NULL_TIMER
+
     # Output lists
     r_smiles = []
     smiles = []
 
-    extension = filename.split('.')[-1]
+    name = get_input_name(filename)
+    extension = name.split('.')[-1]
 
     # Confidence threshold for OCR results
     confidence_threshold = 73.7620468139648
 
+    # Return cached results without reading the image, where available
+    if cache is not None:
+        with timer.stage('cache'):
+            if hasattr(filename, 'read'):
+                img_bytes = filename.read()
+            else:
+                with open(filename, 'rb') as inf:
+                    img_bytes = inf.read()
+            cache_key = cache.key(img_bytes, allow_wildcards, segment_pixel_budget=segment_pixel_budget, dtype=dtype,
+                                  max_pixels=max_pixels, label_method=label_method,
+                                  ocr_session=ocr_session or None)
+            cached_output = cache.get(cache_key)
+        if cached_output is not None:
+            log.info('Results for %s found in cache' % name)
+            return cached_output
+        img_input = BytesIO(img_bytes)
+    else:
+        img_input = filename
+
     # Read in float and raw pixel images
-    fig = imread(filename)
-    fig_bbox = fig.get_bounding_box()
+    with timer.stage('imread'):
+        fig = imread(img_input, dtype=dtype, max_pixels=max_pixels)
+        fig_bbox = fig.get_bounding_box()
 
     # Segment image into pixel islands
-    panels = segment(fig)
+    with timer.stage('segment'):
+        panels = segment(fig, pixel_budget=segment_pixel_budget)
 
     # Initial classify of images, to account for merging in segmentation
-    labels, diags = classify_kmeans(panels, fig)
+    with timer.stage('classify_kmeans'):
+        labels, diags = classify_kmeans(panels, fig)
 
     # Preprocess image (eg merge labels that are small into larger labels)
-    labels, diags = preprocessing(labels, diags, fig)
+    with timer.stage('preprocessing'):
+        labels, diags = preprocessing(labels, diags, fig)
 
     # Re-cluster by height if there are more Diagram objects than Labels
     if len(labels) < len(diags):
-        labels_h, diags_h = classify_kmeans(panels, fig, skel=False)
-        labels_h, diags_h = preprocessing(labels_h, diags_h, fig)
+        with timer.stage('classify_kmeans'):
+            labels_h, diags_h = classify_kmeans(panels, fig, skel=False)
+        with timer.stage('preprocessing'):
+            labels_h, diags_h = preprocessing(labels_h, diags_h, fig)
 
         # Choose the fitting with the closest number of diagrams and labels
         if abs(len(labels_h) - len(diags_h)) < abs(len(labels) - len(diags)):
@@ -292,46 +360,56 @@ def extract_image(filename, debug=False, allow_wildcards=False):
             ['r', 'b', 'g', 'k', 'c', 'm', 'y', 'r', 'b', 'g', 'k', 'c', 'm', 'y', 'r', 'b', 'g', 'k', 'c', 'm', 'y'])
 
     # Add label information to the appropriate diagram by expanding bounding box
-    labelled_diags = label_diags(labels, diags, fig_bbox)
-    labelled_diags = remove_repeating(labelled_diags)
+    with timer.stage('label_diags'):
+        labelled_diags = label_diags(labels, diags, fig_bbox, method=label_method)
+        labelled_diags = remove_repeating(labelled_diags)
 
-    for diag in labelled_diags:
+    # Optionally read all labels from one copy of the image passed to Tesseract
+    session = OcrSession(fig) if ocr_session else None
+    try:
+        for diag in labelled_diags:
 
-        label = diag.label
+            label = diag.label
 
-        if debug is True:
+            if debug is True:
 
-            colour = next(colours)
+                colour = next(colours)
 
-            # Add diag bbox to debug image
-            diag_rect = mpatches.Rectangle((diag.left, diag.top), diag.width, diag.height,
-                                           fill=False, edgecolor=colour, linewidth=2)
-            ax.text(diag.left, diag.top + diag.height / 4, '[%s]' % diag.tag, size=diag.height / 20, color='r')
-            ax.add_patch(diag_rect)
+                # Add diag bbox to debug image
+                diag_rect = mpatches.Rectangle((diag.left, diag.top), diag.width, diag.height,
+                                               fill=False, edgecolor=colour, linewidth=2)
+                ax.text(diag.left, diag.top + diag.height / 4, '[%s]' % diag.tag, size=diag.height / 20, color='r')
+                ax.add_patch(diag_rect)
 
-            # Add label bbox to debug image
-            label_rect = mpatches.Rectangle((label.left, label.top), label.width, label.height,
-                                            fill=False, edgecolor=colour, linewidth=2)
-            ax.text(label.left, label.top + label.height / 4, '[%s]' % label.tag, size=label.height / 5, color='r')
-            ax.add_patch(label_rect)
+                # Add label bbox to debug image
+                label_rect = mpatches.Rectangle((label.left, label.top), label.width, label.height,
+                                                fill=False, edgecolor=colour, linewidth=2)
+                ax.text(label.left, label.top + label.height / 4, '[%s]' % label.tag, size=label.height / 5, color='r')
+                ax.add_patch(label_rect)
 
-        # Read the label
-        diag.label, conf = read_label(fig, label)
+            # Read the label
+            with timer.stage('read_label'):
+                diag.label, conf = read_label(fig, label, session=session)
 
-        if not diag.label.text:
-            log.warning('Text could not be resolved from label %s' % label.tag)
+            if not diag.label.text:
+                log.warning('Text could not be resolved from label %s' % label.tag)
 
-        # Only extract images where the confidence is sufficiently high
-        if not math.isnan(conf) and conf > confidence_threshold:
+            # Only extract images where the confidence is sufficiently high
+            if not math.isnan(conf) and conf > confidence_threshold:
 
-            # Add r-group variables if detected
-            diag = detect_r_group(diag)
+                # Add r-group variables if detected
+                with timer.stage('detect_r_group'):
+                    diag = detect_r_group(diag)
 
-            # Get SMILES for output
-            smiles, r_smiles = get_smiles(diag, smiles, r_smiles, extension)
+                # Get SMILES for output
+                with timer.stage('osra'):
+                    smiles, r_smiles = get_smiles(diag, smiles, r_smiles, extension)
 
-        else:
-            log.warning('Confidence of label %s deemed too low for extraction' % diag.label.tag)
+            else:
+                log.warning('Confidence of label %s deemed too low for extraction' % diag.label.tag)
+    finally:
+        if session is not None:
+            session.close()
 
     log.info('The results are :')
     log.info('R-smiles %s' % r_smiles)
@@ -351,15 +429,21 @@ def extract_image(filename, debug=False, allow_wildcards=False):
     for result in output:
         log.info(result)
 
+    if cache is not None:
+        cache.set(cache_key, output)
+
     return output
 
 
-def extract_images(dirname, debug=False, allow_wildcards=False):
+def extract_images(dirname, debug=False, allow_wildcards=False, workers=None, ordered=True, cache=None):
     """ Extracts the chemical schematic diagrams from a directory of input images
 
     :param dirname: Location of directory, with figures to be extracted
     :param debug: Boolean specifying verbose debug mode.
     :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
+    :param workers: Number of worker processes to extract with. Images are extracted serially if None or 1
+    :param ordered: Bool to indicate whether results are returned in input order, or in order of completion
+    :param cache: ResultCache used to store and look up results for identical images (optional)
 
     :return results: List of chemical record objects, enriched with chemical diagram information
     """
@@ -367,57 +451,201 @@ def extract_images(dirname, debug=False, allow_wildcards=False):
     log.info('Extracting all images at %s ...' % dirname)
 
     results = []
+    for path, result, error, timings in iter_extract_images(dirname, debug, allow_wildcards, workers, ordered, cache):
+        if error is not None:
+            raise error
+        results.append(result)
+
+    log.info('Results extracted sucessfully:')
+    log.info(results)
+
+    return results
+
+
+def iter_extract_images(dirname, debug=False, allow_wildcards=False, workers=None, ordered=True, cache=None):
+    """ Extracts the chemical schematic diagrams from a directory of input images, yielding the output of each
+    figure as soon as it finishes.
+
+    Results are never accumulated, so memory use does not grow with the size of the corpus. Errors are yielded
+    rather than raised, so a single bad figure does not stop the run.
+
+    :param dirname: Location of directory, with figures to be extracted
+    :param debug: Boolean specifying verbose debug mode.
+    :param allow_wildcards: Bool to indicate whether results containing wildcards are permitted
+    :param workers: Number of worker processes to extract with. Images are extracted serially if None or 1
+    :param ordered: Bool to indicate whether results are yielded in input order, or in order of completion
+    :param cache: ResultCache used to store and look up results for identical images (optional)
+
+    :return: Generator of (path, results, error, timings) tuples, where error is None if extraction succeeded
+    :rtype: Iterator[tuple[string, list[tuple[list[string],string]], Exception, dict]]
+    """
+
+    extract = functools.partial(run_timed, extract_image, debug=debug, allow_wildcards=allow_wildcards, cache=cache)
+    imgs = get_inputs(dirname)
+
+    if workers is None or workers <= 1:
+        for file in imgs:
+            yield extract(file)
+    else:
+        log.info('Extracting with %s worker processes...' % workers)
+        # Worker processes read the thread limits when they load numpy and scipy, so set them before starting
+        with limit_threads_environ():
+            pool = multiprocessing.Pool(workers, initializer=init_worker)
+        with pool:
+            if ordered:
+                results = pool.imap(extract, imgs, chunksize=1)
+            else:
+                results = pool.imap_unordered(extract, imgs, chunksize=1)
+            for result in results:
+                yield result
+
+
+def run_timed(extract, f, *args, **kwargs):
+    """ Runs an extraction function on a single input, capturing its output, any error raised and the time taken.
+
+    The extraction function must accept a 'timer' keyword argument, which is used to record per-stage timings.
+
+    :param extract: Extraction function to run (eg. extract_image)
+    :param f: Input passed as the first argument of 'extract'
+
+    :return: Tuple of (path, results, error, timings), where timings maps each stage name to its wall and CPU time
+    """
+
+    path = get_input_name(f)
+    results, error = None, None
+    timer = StageTimer()
+
+    try:
+        with timer.stage('total'):
+            results = extract(f, *args, timer=timer, **kwargs)
+    except Exception as e:
+        log.error('Could not extract input at %s : %s' % (path, e))
+        error = e
+
+    return path, results, error, dict(timer.timings)
+
+
+def get_inputs(dirname):
+    """ Returns a generator of the inputs contained in a directory or a compressed archive.
+
+    Archive members are read straight into memory one at a time, rather than extracted to disk. They are returned as
+    file-like objects, named '<archive path>/<member name>'.
+
+    :param dirname: Location of directory, or a .zip / .tar / .tar.gz (.tgz) archive
+
+    :return: Generator of file paths (for directories) or file-like objects (for archives)
+    :rtype: Iterator[string|BytesIO]
+    """
 
     if os.path.isdir(dirname):
         # Extract from all files in directory
-        for file in os.listdir(dirname):
-            results.append(extract_image(os.path.join(dirname, file), debug, allow_wildcards))
+        return (os.path.join(dirname, file) for file in os.listdir(dirname))
 
     elif os.path.isfile(dirname):
 
-        # Unzipping compressed inputs
-        if dirname.endswith('zip'):
-            # Logic to unzip the file locally
+        if dirname.endswith('.zip'):
             log.info('Opening zip file...')
-            zip_ref = zipfile.ZipFile(dirname)
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            zip_ref.extractall(extracted_path)
-            zip_ref.close()
-
-        elif dirname.endswith('tar.gz'):
-            # Logic to unzip tarball locally
+            return iter_zip_members(dirname)
+
+        elif dirname.endswith(('.tar.gz', '.tgz')):
             log.info('Opening tarball file...')
-            tar_ref = tarfile.open(dirname, 'r:gz')
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            tar_ref.extractall(extracted_path)
-            tar_ref.close()
-
-        elif dirname.endswith('tar'):
-            # Logic to unzip tarball locally
+            return iter_tar_members(dirname, 'r|gz')
+
+        elif dirname.endswith('.tar'):
             log.info('Opening tarball file...')
-            tar_ref = tarfile.open(dirname, 'r:')
-            extracted_path = os.path.join(os.path.dirname(dirname), 'extracted')
-            if not os.path.exists(extracted_path):
-                os.makedirs(extracted_path)
-            tar_ref.extractall(extracted_path)
-            tar_ref.close()
+            return iter_tar_members(dirname, 'r|')
+
         else:
             # Logic for wrong file type
             log.error('Input not a directory')
             raise NotADirectoryError
 
-        imgs = [os.path.join(extracted_path, doc) for doc in os.listdir(extracted_path)]
-        for file in imgs:
-            results.append(extract_image(file, debug, allow_wildcards))
+    return iter([])
 
-    log.info('Results extracted sucessfully:')
-    log.info(results)
 
-    return results
+def iter_zip_members(path):
+    """ Yields each file in a zip archive as an in-memory file-like object.
+
+    :param path: Location of zip archive
+    """
+
+    with zipfile.ZipFile(path) as zip_ref:
+        for member in zip_ref.infolist():
+            if member.filename.endswith('/'):
+                continue
+            f = BytesIO(zip_ref.read(member))
+            f.name = os.path.join(path, member.filename)
+            yield f
+
+
+def iter_tar_members(path, mode):
+    """ Yields each file in a tar archive as an in-memory file-like object.
+
+    The archive is read as a stream, so members are decompressed one at a time in archive order.
+
+    :param path: Location of tar archive
+    :param mode: Mode used to open the archive (eg. 'r|gz')
+    """
+
+    with tarfile.open(path, mode) as tar_ref:
+        for member in tar_ref:
+            if not member.isfile():
+                continue
+            f = BytesIO(tar_ref.extractfile(member).read())
+            f.name = os.path.join(path, member.name)
+            yield f
+
+
+def get_input_name(f):
+    """ Returns the name of an input given either as a path or as a file-like object.
+
+    :param f: Path or file-like object with a 'name' attribute
+    :rtype: string
+    """
+
+    return getattr(f, 'name', f)
+
+
+@contextlib.contextmanager
+def limit_threads_environ(threads=1):
+    """ Context manager setting the environment variables that limit native thread pools (OpenMP, BLAS).
+
+    The variables are only read when numpy and scipy are first loaded, so they limit processes started inside the block
+    (eg. spawned workers), not the current process. The previous values are restored on exit.
+
+    :param threads: Maximum number of native threads available to each process
+    """
+
+    previous = {var: os.environ.get(var) for var in THREAD_LIMIT_VARS}
+    os.environ.update({var: str(threads) for var in THREAD_LIMIT_VARS})
+    try:
+        yield
+    finally:
+        for var, value in previous.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+
+def init_worker(threads=1):
+    """ Initialises a worker process used for parallel extraction.
+
+    Native thread pools (OpenMP, BLAS) are capped to avoid oversubscribing the cores shared between workers, and the
+    Tesseract APIs used for OCR are initialized. Errors initializing Tesseract are logged rather than raised, as a pool
+    replaces workers whose initializer fails indefinitely. They are raised again for each input that needs OCR.
+
+    :param threads: Maximum number of native threads available to each worker
+    """
+
+    # Forked workers inherit thread pools already loaded by the parent process, which can only be capped at runtime
+    threadpool_limits(threads)
+
+    # Load the OCR trained data once, rather than during the first extraction
+    try:
+        warmup()
+    except Exception as e:
+        log.warning('Could not initialize Tesseract in worker %s: %s' % (os.getpid(), e))
 
 
 def get_smiles(diag, smiles, r_smiles, extension='jpg'):
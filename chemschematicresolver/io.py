@@ -24,29 +24,49 @@ import numpy as np
 from PIL import Image
 from skimage import img_as_float, img_as_ubyte, img_as_uint
 from skimage import io as skio
+from skimage.io._plugins.pil_plugin import pil_to_ndarray
 from skimage.color import gray2rgb
 import os
 import csv
+import tempfile
 
 import warnings
 
 from .model import Figure
+from .utils import convert_greyscale
 
 log = logging.getLogger(__name__)
 
+#: Image data type policies accepted by imread
+DTYPES = ['float64', 'float32', 'uint8']
 
-def imread(f, raw=False):
+
+def imread(f, raw=False, dtype='float64', max_pixels=None):
     """Read an image from a file, create Figure object
     :param string|file f: Filename or file-like object.
+    :param bool raw: Keep the pixel values as read from the file.
+    :param string dtype: Data type policy. 'float64' gives RGB values between 0 and 1 (24 bytes per pixel), 'float32'
+                         gives the same at half the memory, and 'uint8' gives greyscale values between 0 and 255
+                         (1 byte per pixel).
+    :param int max_pixels: Maximum number of pixels. Larger images are downscaled while decoding (optional)
     :return: Figure object.
     :rtype: Figure
     """
 
+    if dtype not in DTYPES:
+        raise ValueError('Unknown image dtype %s' % dtype)
+
     with warnings.catch_warnings(record=True) as ws:
-        img = skio.imread(f, plugin='pil')
+        if max_pixels is None:
+            img = skio.imread(f, plugin='pil')
+        else:
+            img = imread_reduced(f, max_pixels)
+
+    if dtype == 'uint8' and not raw:
+        if img.ndim == 3:
+            img = rgb2grey_ubyte(img)
+        return Figure(img_as_ubyte(img))
 
-    # Transform all images pixel values to be floating point values between 0 and 1 (i.e. not ints 0-255)
-    # Recommended in skimage-tutorials "Images are numpy arrays" because this what scikit-image uses internally
     # Transform greyscale images to RGB
     if len(img.shape) == 2:
         log.debug('Converting greyscale image to RGB...')
@@ -55,12 +75,71 @@ def imread(f, raw=False):
     # Transform all images pixel values to be floating point values between 0 and 1 (i.e. not ints 0-255)
     # Recommended in skimage-tutorials "Images are numpy arrays" because this what scikit-image uses internally
     if not raw:
-        img = img_as_float(img)
+        img = img_as_float32(img) if dtype == 'float32' else img_as_float(img)
     fig = Figure(img)
 
     return fig
 
 
+def imread_reduced(f, max_pixels):
+    """Read an image, downscaled to at most max_pixels pixels.
+
+    JPEG images are decoded straight to a reduced size (by a factor of up to 8), so the full size image is never held
+    in memory. The remaining reduction, and that of other formats, uses area averaging.
+
+    :param string|file f: Filename or file-like object.
+    :param int max_pixels: Maximum number of pixels.
+    :return: Image.
+    :rtype: numpy.ndarray
+    """
+    im = Image.open(f)
+    width, height = im.size
+
+    if width * height > max_pixels:
+        scale = np.sqrt(max_pixels / (width * height))
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        log.debug('Reducing image from %s to %s' % (im.size, size))
+
+        # Choose the smallest decoder scale that is at least the target size (JPEG only)
+        im.draft(im.mode, size)
+        if im.size != size:
+            im = im.resize(size, Image.BOX)
+
+    return pil_to_ndarray(im)
+
+
+def rgb2grey_ubyte(img):
+    """Convert an RGB image to uint8 greyscale.
+
+    Uses the same weights as the float pipeline (see :func:`skimage.color.rgb2gray`), so thresholds agree. For uint8
+    images this is computed in float32 one channel at a time, rather than from a float64 copy of the whole image.
+
+    :param numpy.ndarray img: RGB or RGBA image.
+    :return: Greyscale image.
+    :rtype: numpy.ndarray
+    """
+    if img.dtype != np.uint8:
+        return img_as_ubyte(convert_greyscale(img))
+
+    grey = np.zeros(img.shape[:2], dtype=np.float32)
+    for channel, weight in enumerate([0.2125, 0.7154, 0.0721]):
+        grey += np.multiply(img[..., channel], np.float32(weight), dtype=np.float32)
+    np.rint(grey, out=grey)
+    return np.clip(grey, 0, 255, out=grey).astype(np.uint8)
+
+
+def img_as_float32(img):
+    """Convert an image to float32 values between 0 and 1, without an intermediate float64 copy.
+
+    :param numpy.ndarray img: Input image.
+    :return: Float32 image.
+    :rtype: numpy.ndarray
+    """
+    if img.dtype.kind == 'u':
+        return img.astype(np.float32) / np.float32(np.iinfo(img.dtype).max)
+    return img_as_float(img).astype(np.float32)
+
+
 def imsave(f, img):
     """Save an image to file.
     :param string|file f: Filename or file-like object.
@@ -71,6 +150,21 @@ def imsave(f, img):
         skio.imsave(f, img, plugin='pil', quality=100)
 
 
+def imsave_temp(img, extension='jpg', prefix='csr_temp_'):
+    """Save an image to a new temporary file, with a unique name.
+
+    :param numpy.ndarray img: Image to save.
+    :param string extension: File extension, which sets the image format.
+    :param string prefix: Start of the file name.
+    :return: Path of the file. Delete it with imdel once finished.
+    :rtype: string
+    """
+    fd, path = tempfile.mkstemp(suffix='.' + extension, prefix=prefix)
+    os.close(fd)
+    imsave(path, img)
+    return path
+
+
 def imdel(f):
     """ Delete an image file
     """
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Journal
+=======
+
+Checkpoint journal used to resume interrupted corpus extractions.
+
+author: Ed Beard
+email: ejb207@cam.ac.uk
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import json
+import os
+
+log = logging.getLogger(__name__)
+
+
+class Journal(object):
+    """ Append-only JSON lines file recording the output of each finished input.
+
+    Each line is written and flushed to disk as soon as an input finishes, so a crashed run loses at most the input
+    being processed. A partially written final line (from a crash mid-write) is ignored when the journal is read.
+
+    The first line records the settings the outputs were extracted with. Opening the journal with different settings
+    raises a ValueError, so outputs from one configuration are never replayed into a run with another.
+    """
+
+    def __init__(self, path, settings=None):
+        """
+
+        :param string path: Location of the journal file. Created if it does not exist.
+        :param dict settings: JSON serializable settings used for extraction (eg. allow_wildcards)
+        """
+        self.path = path
+        # Round trip through JSON, so settings compare equal to those read back from the file
+        self.settings = json.loads(json.dumps(settings))
+        self.completed = self._read()
+
+    def __contains__(self, input_path):
+        return input_path in self.completed
+
+    def __len__(self):
+        return len(self.completed)
+
+    def get(self, input_path):
+        """ Returns the recorded output for an input, or None if it has not been completed.
+
+        Outputs read back from the file are JSON types, so tuples are returned as lists.
+        """
+        return self.completed.get(input_path)
+
+    def record(self, input_path, results):
+        """ Appends the output of a finished input to the journal.
+
+        :param string input_path: Location of the finished input
+        :param results: JSON serializable output of the input
+        """
+        with open(self.path, 'a') as outf:
+            outf.write(json.dumps({'path': input_path, 'results': results}) + '\n')
+            outf.flush()
+            os.fsync(outf.fileno())
+        self.completed[input_path] = results
+
+    def _read(self):
+        """ Reads all completed entries from the journal file."""
+
+        completed = {}
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            with open(self.path, 'w') as outf:
+                outf.write(json.dumps({'settings': self.settings}) + '\n')
+            return completed
+
+        with open(self.path, 'r') as inf:
+            lines = inf.read().split('\n')
+
+        settings = None
+        for i, line in enumerate(lines):
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                log.warning('Skipping incomplete entry in journal %s' % self.path)
+                continue
+            if i == 0 and 'settings' in entry:
+                settings = entry['settings']
+                continue
+            completed[entry['path']] = entry['results']
+
+        if settings != self.settings:
+            raise ValueError('Journal %s was recorded with settings %s, not %s' % (self.path, settings, self.settings))
+
+        # Terminate any partially written final line, so new entries start on a line of their own
+        if lines[-1]:
+            with open(self.path, 'a') as outf:
+                outf.write('\n')
+
+        log.info('%s completed inputs found in journal %s' % (len(completed), self.path))
+        return completed
@@ -31,6 +31,8 @@ log = logging.getLogger(__name__)
 class Rect(object):
     """A rectangular region."""
 
+    __slots__ = ('left', 'right', 'top', 'bottom')
+
     def __init__(self, left, right, top, bottom):
         """
 
@@ -149,6 +151,8 @@ class Rect(object):
 class Panel(Rect):
     """ Tagged section inside Figure"""
 
+    __slots__ = ('tag', '_repeating', '_pixel_ratio')
+
     def __init__(self, left, right, top, bottom, tag=0):
         super(Panel, self).__init__(left, right, top, bottom)
         self.tag = tag
@@ -175,6 +179,8 @@ class Panel(Rect):
 class Diagram(Panel):
     """ Chemical Schematic Diagram that is identified"""
 
+    __slots__ = ('_label', '_smile', '_fig')
+
     def __init__(self, *args, label=None, smile=None, fig=None):
         self._label = label
         self._smile = smile
@@ -246,8 +252,13 @@ class Diagram(Panel):
 class Label(Panel):
     """ Label used as an identifier for the closest Chemical Schematic Diagram"""
 
+    __slots__ = ('r_group', 'values', '_text')
+
     def __init__(self, *args):
         super(Label, self).__init__(*args)
+
+        # List of lists of tuples containing variable-value-label triplets.
+        # Each list represents a particular combination of chemicals yielding a unique compound.
         self.r_group = []
         self.values = []
 
@@ -259,20 +270,194 @@ class Label(Panel):
     def text(self, text):
         self._text = text
 
-    def r_group(self):
-        """ List of lists of tuples containing variable-value-label triplets.
-            Each list represents a particular combination of chemicals yielding a unique compound.
-
-            :param : List(str,str,List(str)) : A list of variable-value pairs and their list of candidate labels
-        """
-        return self.r_group
-
     def add_r_group_variables(self, var_value_label_tuples):
         """ Updates the R-groups for this label."""
 
         self.r_group.append(var_value_label_tuples)
 
 
+class RectArray(object):
+    """Many rectangles stored as columns of numpy arrays, for vectorized geometry.
+
+    Pairwise methods return a matrix with a row for each rectangle in this array and a column for each rectangle in
+    ``other`` (which defaults to this array), matching the equivalent :class:`Rect` method applied to every pair.
+    """
+
+    def __init__(self, left, right, top, bottom, tag=None):
+        """
+
+        :param left: Left edges.
+        :param right: Right edges.
+        :param top: Top edges.
+        :param bottom: Bottom edges.
+        :param tag: Tags (optional, defaults to 0).
+        """
+        self.left = np.asarray(left)
+        self.right = np.asarray(right)
+        self.top = np.asarray(top)
+        self.bottom = np.asarray(bottom)
+        self.tag = np.zeros(len(self.left), dtype=int) if tag is None else np.asarray(tag)
+
+    @classmethod
+    def from_rects(cls, rects):
+        """Create a RectArray from a list of Rects. Rects without a tag are given a tag of 0.
+
+        :param list[Rect] rects: Input rectangles.
+        :rtype: RectArray
+        """
+        columns = [[getattr(rect, name) for rect in rects] for name in ['left', 'right', 'top', 'bottom']]
+        tags = [getattr(rect, 'tag', 0) for rect in rects]
+        return cls(*columns, tag=tags)
+
+    def to_rects(self, cls=Panel):
+        """Convert to a list of rectangle objects.
+
+        :param type cls: Rect class to create. Subclasses of Panel are given the tags.
+        :rtype: list[Rect]
+        """
+        columns = [self.left.tolist(), self.right.tolist(), self.top.tolist(), self.bottom.tolist()]
+        if issubclass(cls, Panel):
+            columns.append(self.tag.tolist())
+        return [cls(*values) for values in zip(*columns)]
+
+    def __len__(self):
+        return len(self.left)
+
+    def __getitem__(self, index):
+        """Select rectangles by integer index array, boolean mask or slice.
+
+        :rtype: RectArray
+        """
+        if isinstance(index, (int, np.integer)):
+            index = [index]
+        return RectArray(self.left[index], self.right[index], self.top[index], self.bottom[index], self.tag[index])
+
+    def __repr__(self):
+        return '<%s: %s rects>' % (self.__class__.__name__, len(self))
+
+    def __str__(self):
+        return '<%s: %s rects>' % (self.__class__.__name__, len(self))
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    @property
+    def height(self):
+        return self.bottom - self.top
+
+    @property
+    def area(self):
+        return self.width * self.height
+
+    @property
+    def center(self):
+        """Center points of the rectangles, as arrays of x and y coordinates.
+
+        :rtype: tuple(numpy.ndarray, numpy.ndarray)
+        """
+        return (self.left + self.right) / 2, (self.bottom + self.top) / 2
+
+    def overlaps(self, other=None):
+        """Pairwise :meth:`Rect.overlaps`.
+
+        :rtype: numpy.ndarray
+        """
+        other = self if other is None else other
+        return ((np.minimum.outer(self.right, other.right) > np.maximum.outer(self.left, other.left)) &
+                (np.minimum.outer(self.bottom, other.bottom) > np.maximum.outer(self.top, other.top)))
+
+    def contains(self, other=None):
+        """Pairwise :meth:`Rect.contains`, True where the rectangle in ``other`` is within the rectangle in this array.
+
+        :rtype: numpy.ndarray
+        """
+        other = self if other is None else other
+        return (np.less_equal.outer(self.left, other.left) & np.greater_equal.outer(self.right, other.right) &
+                np.less_equal.outer(self.top, other.top) & np.greater_equal.outer(self.bottom, other.bottom))
+
+    def separation(self, other=None):
+        """Pairwise :meth:`Rect.separation`, the distance between centers.
+
+        :rtype: numpy.ndarray
+        """
+        other = self if other is None else other
+        dx, dy = self._center_offsets(other)
+        return np.hypot(dx, dy)
+
+    def compass(self, other=None):
+        """Pairwise :meth:`Diagram.compass_position`, the position ('N', 'S', 'E' or 'W') of each rectangle in
+        ``other`` relative to each rectangle in this array. None where the position is diagonal.
+
+        :rtype: numpy.ndarray
+        """
+        other = self if other is None else other
+        dx, dy = self._center_offsets(other)
+        compass = np.full(dx.shape, None, dtype=object)
+        horizontal = np.abs(dx) > np.abs(dy)
+        vertical = np.abs(dx) < np.abs(dy)
+        compass[horizontal & (dx > 0)] = 'E'
+        compass[horizontal & (dx <= 0)] = 'W'
+        compass[vertical & (dy > 0)] = 'S'
+        compass[vertical & (dy <= 0)] = 'N'
+        return compass
+
+    def expansions(self, other, rate=1):
+        """Pairwise number of times each rectangle in this array must be expanded by ``rate`` on every side before it
+        overlaps each rectangle in ``other``. Infinite where it never would (``other`` has zero width or height).
+
+        :rtype: numpy.ndarray
+        """
+        # The smallest k with k * rate greater than the gap between the edges, on either side and in either axis
+        gaps = [np.subtract.outer(-self.right, -other.left), np.subtract.outer(self.left, other.right),
+                np.subtract.outer(-self.bottom, -other.top), np.subtract.outer(self.top, other.bottom)]
+        steps = np.maximum.reduce([np.floor_divide(gap, rate) + 1 for gap in gaps])
+        steps = np.maximum(steps, 1).astype(float)
+        steps[:, (other.width <= 0) | (other.height <= 0)] = np.inf
+        return steps
+
+    def directional_expansions(self, other, direction, rate=1):
+        """Pairwise number of times one edge of each rectangle in this array must be moved outwards by ``rate``
+        before it overlaps each rectangle in ``other``. Infinite where it never would.
+
+        :param RectArray other: Rectangles to reach.
+        :param string direction: Edge to move ('E', 'S', 'W' or 'N').
+        :param rate: Distance moved on each step.
+        :rtype: numpy.ndarray
+        """
+        if direction in ['E', 'W']:
+            # The other axis does not move, so must already overlap
+            fixed = np.minimum.outer(self.bottom, other.bottom) > np.maximum.outer(self.top, other.top)
+            fixed &= (other.width > 0)[np.newaxis, :]
+            if direction == 'E':
+                fixed &= np.less.outer(self.left, other.right)
+                gap = np.subtract.outer(-self.right, -other.left)
+            else:
+                fixed &= np.greater.outer(self.right, other.left)
+                gap = np.subtract.outer(self.left, other.right)
+        elif direction in ['S', 'N']:
+            fixed = np.minimum.outer(self.right, other.right) > np.maximum.outer(self.left, other.left)
+            fixed &= (other.height > 0)[np.newaxis, :]
+            if direction == 'S':
+                fixed &= np.less.outer(self.top, other.bottom)
+                gap = np.subtract.outer(-self.bottom, -other.top)
+            else:
+                fixed &= np.greater.outer(self.bottom, other.top)
+                gap = np.subtract.outer(self.top, other.bottom)
+        else:
+            raise ValueError('Unknown compass direction %s' % direction)
+
+        steps = np.maximum(np.floor_divide(gap, rate) + 1, 1).astype(float)
+        steps[~fixed] = np.inf
+        return steps
+
+    def _center_offsets(self, other):
+        """Offsets from the centers of the rectangles in this array to the centers of those in ``other``."""
+        x, y = self.center
+        other_x, other_y = other.center
+        return other_x[np.newaxis, :] - x[:, np.newaxis], other_y[np.newaxis, :] - y[:, np.newaxis]
+
+
 class RGroup(object):
     """ Object containing all extracted information for an R-group result"""
 
@@ -297,9 +482,31 @@ class RGroup(object):
         return tuple_r_group
 
 
+def read_only(img):
+    """Marks an image array as read-only, so that it can be shared safely.
+
+    :param numpy.ndarray img: Image array.
+    :return: The same array.
+    :rtype: numpy.ndarray
+    """
+    img.flags.writeable = False
+    return img
+
+
 @decorators.python_2_unicode_compatible
 class Figure(object):
-    """A figure image."""
+    """A figure image.
+
+    Images derived from ``img`` (greyscale, binary and skeleton) are computed on first access and shared
+    by every stage of the pipeline. Assigning a new ``img`` clears them. If ``img`` is modified in place,
+    call :meth:`invalidate` instead.
+
+    Derived images are read-only, as Figures made from them (eg. by :func:`utils.binarize`) share their memory. Use
+    :meth:`view` to work on a region without copying, and :meth:`copy` before modifying an image in place.
+    """
+
+    #: Threshold used to binarize the greyscale image (empirically determined)
+    BINARY_THRESHOLD = 0.85
 
     def __init__(self, img, panels=None, plots=None, photos=None):
         """
@@ -318,6 +525,79 @@ class Figure(object):
 
         # TODO: Image metadata?
 
+    @property
+    def img(self):
+        """Figure image.
+
+        :rtype: numpy.ndarray
+        """
+        return self._img
+
+    @img.setter
+    def img(self, img):
+        self._img = img
+        self.invalidate()
+
+    def invalidate(self):
+        """Clear all cached images and results derived from ``img``."""
+        for attr_name in ['_greyscale', '_binary', '_skeleton']:
+            self.__dict__.pop(attr_name, None)
+
+        # Label image of the panel regions found by segmentation, at 1 / panel_tags_scale of full resolution
+        self.panel_tags = None
+        self.panel_tags_scale = 1
+
+        # Text recognized in regions of the image, keyed by region and OCR settings (see ocr.read_region)
+        self.ocr_results = {}
+
+    def view(self, left=None, right=None, top=None, bottom=None):
+        """Figure of a region of the image, sharing memory with this Figure (see :func:`utils.crop`).
+
+        :rtype: Figure
+        """
+        from .utils import crop
+        return Figure(crop(self.img, left, right, top, bottom))
+
+    def copy(self):
+        """Figure with a copy of the image. Derived images are not copied, and are recomputed on demand.
+
+        :rtype: Figure
+        """
+        return Figure(self.img.copy())
+
+    @decorators.memoized_property
+    def greyscale(self):
+        """Greyscale version of the image.
+
+        :rtype: numpy.ndarray
+        """
+        from .utils import convert_greyscale
+        greyscale = convert_greyscale(self.img)
+        if greyscale is self.img:
+            return greyscale
+        return read_only(greyscale)
+
+    @decorators.memoized_property
+    def binary(self):
+        """Binary version of the image, where True pixels are dark.
+
+        :rtype: numpy.ndarray
+        """
+        from .utils import white
+        if self.img.ndim <= 2 and self.img.dtype == bool:
+            return self.img
+        return read_only(self.greyscale < self.BINARY_THRESHOLD * white(self.greyscale))
+
+    @decorators.memoized_property
+    def skeleton(self):
+        """Skeleton of the binary image.
+
+        :rtype: numpy.ndarray
+        """
+        from skimage.morphology import skeletonize
+        # Cython routines in skimage do not accept read-only buffers
+        return read_only(skeletonize(self.binary.copy()))
+
     def __repr__(self):
         return '<%s>' % self.__class__.__name__
 
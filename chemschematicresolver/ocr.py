@@ -21,14 +21,16 @@ from __future__ import unicode_literals
 import collections
 import enum
 import logging
+import threading
 import warnings
 
 import numpy as np
 import tesserocr
+from skimage import img_as_ubyte
 from chemdataextractor.doc.text import Sentence
 
 from . import decorators, io, model
-from .utils import convert_greyscale, crop, pad
+from .utils import crop, pad_white, white
 from .parse import ChemSchematicResolverTokeniser, LabelParser
 
 
@@ -44,30 +46,33 @@ SEPERATORS = ','
 OTHER = '\'`/'
 LABEL_WHITELIST = ASSIGNMENT + DIGITS + ALPHABET_UPPER + ALPHABET_LOWER + CONCENTRATION + SEPERATORS + OTHER
 
+# Initialized Tesseract APIs, kept separately by each thread as they cannot be shared between threads
+_api_pool = threading.local()
 
-def read_diag_text(fig, diag, whitelist=LABEL_WHITELIST):
-    """ Reads a diagram using OCR and returns the textual OCR objects"""
-    img = convert_greyscale(fig.img)
-    cropped_img = crop(img, diag.left, diag.right, diag.top, diag.bottom)
-    text = get_text(cropped_img, x_offset=diag.left, y_offset=diag.top, psm=PSM.SINGLE_BLOCK, whitelist=whitelist)
+
+def read_diag_text(fig, diag, whitelist=LABEL_WHITELIST, session=None):
+    """ Reads a diagram using OCR and returns the textual OCR objects
+
+    :param OcrSession session: Open session on fig, used to read the diagram without cropping the image (optional)
+    """
+    # Only the words are used
+    text = read_region(fig, diag, whitelist, level=RIL.WORD, light=True, session=session)
     tokens = get_words(text)
     return tokens
 
 
-def read_label(fig, label, whitelist=LABEL_WHITELIST):
+def read_label(fig, label, whitelist=LABEL_WHITELIST, session=None):
     """ Reads a label paragraph objects using ocr
 
     :param numpy.ndarray img: Input unprocessedimage
     :param Label label: Label object containing appropriate bounding box
+    :param OcrSession session: Open session on fig, used to read the label without cropping the image (optional)
 
     :rtype List[List[str]]
     """
 
-    size = 5
-    img = convert_greyscale(fig.img)
-    cropped_img = crop(img, label.left, label.right, label.top, label.bottom)
-    padded_img = pad(cropped_img, size, mode='constant', constant_values=(1, 1))
-    text = get_text(padded_img, x_offset=label.left, y_offset=label.top, psm=PSM.SINGLE_BLOCK, whitelist=whitelist)
+    # Only the line text and block confidences are used
+    text = read_region(fig, label, whitelist, level=RIL.TEXTLINE, light=True, size=5, session=session)
     if not text:
         label.text = []
         return label, 0
@@ -163,6 +168,149 @@ class RIL(enum.IntEnum):
     WORD = tesserocr.RIL.WORD
 
 
+def read_region(fig, rect, whitelist=LABEL_WHITELIST, psm=PSM.SINGLE_BLOCK, level=RIL.SYMBOL, light=False, size=0,
+                session=None):
+    """ Reads a region of a figure using OCR, recognizing each region only once per figure.
+
+    Results are stored on the figure (see Figure.ocr_results) keyed by the region and OCR settings, so the same label
+    read by several preprocessing passes and by extraction is only passed to Tesseract the first time. Regions read
+    in a session and from a padded crop are stored separately, as Tesseract sees different pixels around them.
+
+    :param Figure fig: Input figure.
+    :param Rect rect: Region to read.
+    :param string whitelist: String containing allowed characters.
+    :param PSM psm: Page segmentation mode.
+    :param RIL level: Deepest level of text elements to get (see get_text).
+    :param bool light: Whether to get only the text, bounding box and confidence of each element (see get_text).
+    :param int size: Width of the white border added around the cropped region, when read without a session.
+    :param OcrSession session: Open session on fig. Used if it has the same psm and whitelist (optional)
+    :return: List of text blocks.
+    :rtype: list[TextBlock]
+    """
+    use_session = session is not None and session.psm == psm and session.whitelist == whitelist
+    path = ('session', session.margin) if use_session else ('crop', size)
+    key = (rect.left, rect.right, rect.top, rect.bottom, whitelist, int(psm), int(level), light, path)
+    if key in fig.ocr_results:
+        return fig.ocr_results[key]
+
+    if use_session:
+        text = session.get_text(rect, level=level, light=light)
+    else:
+        img = crop(fig.greyscale, rect.left, rect.right, rect.top, rect.bottom)
+        if size:
+            img = pad_white(img, size)
+        text = get_text(img, x_offset=rect.left, y_offset=rect.top, psm=psm, whitelist=whitelist, level=level,
+                        light=light)
+
+    fig.ocr_results[key] = text
+    return text
+
+
+def get_api(psm=PSM.AUTO, whitelist=None, slot=None):
+    """ Returns an initialized Tesseract API for this thread, with the given settings.
+
+    Initializing an API loads the trained data, which takes tens of milliseconds, so one API is created per thread for
+    each combination of settings and reused. Callers should Clear() the API once they are finished with an image.
+
+    :param PSM psm: Page segmentation mode.
+    :param string whitelist: String containing allowed characters.
+    :param string slot: Name of a separate API with the same settings, for callers keeping an image set between calls.
+    :rtype: tesserocr.PyTessBaseAPI
+    """
+    apis = getattr(_api_pool, 'apis', None)
+    if apis is None:
+        apis = _api_pool.apis = {}
+
+    key = (int(psm), whitelist, slot)
+    if key not in apis:
+        api = tesserocr.PyTessBaseAPI(psm=psm)
+        if whitelist is not None:
+            api.SetVariable('tessedit_char_whitelist', whitelist)
+        apis[key] = api
+    return apis[key]
+
+
+def warmup():
+    """ Initializes the Tesseract APIs used to read labels and diagrams in this thread.
+
+    Called when a worker process starts, so the trained data is not loaded during its first extraction.
+    """
+    get_api(PSM.SINGLE_BLOCK, LABEL_WHITELIST)
+    get_api(PSM.SINGLE_BLOCK, LABEL_WHITELIST, slot=OcrSession.SLOT)
+
+
+class OcrSession(object):
+    """ Reads text from many regions of one Figure, passing the image to Tesseract only once.
+
+    The greyscale figure is set on a Tesseract API as a uint8 buffer when the session opens. Each region is then
+    recognized by restricting Tesseract to it with SetRectangle, so regions are not cropped, padded or converted.
+    Tesseract reports bounding boxes in the coordinates of the whole image, so text elements need no offsets.
+
+    Unlike a cropped region, which is padded with white, the margin around each region holds the neighbouring pixels
+    of the figure. Text read in a session can therefore differ from text read without one.
+
+    Only one session can be open at a time in each thread, as they share one pooled API. Use as a context manager, so the image is released when the session closes::
+
+        with OcrSession(fig) as session:
+            label, conf = read_label(fig, label, session=session)
+    """
+
+    #: Pooled API used by sessions, kept separate as the image stays set between calls
+    SLOT = 'session'
+
+    def __init__(self, fig, psm=PSM.SINGLE_BLOCK, whitelist=LABEL_WHITELIST, margin=5):
+        """
+
+        :param Figure fig: Figure to read.
+        :param PSM psm: Page segmentation mode.
+        :param string whitelist: String containing allowed characters.
+        :param int margin: Pixels around each region also passed to Tesseract, which struggles with text at the edge
+                           of its image. Clipped to the figure.
+        """
+        if getattr(_api_pool, 'session', None) is not None:
+            raise RuntimeError('An OcrSession is already open in this thread')
+
+        img = np.ascontiguousarray(img_as_ubyte(fig.greyscale))
+        self.height, self.width = img.shape
+        self.psm = psm
+        self.whitelist = whitelist
+        self.margin = margin
+        self.api = get_api(psm, whitelist, slot=self.SLOT)
+        self.api.SetImageBytes(img.tobytes(), self.width, self.height, 1, self.width)
+        _api_pool.session = self
+
+    def get_text(self, rect, padding=0, level=RIL.SYMBOL, light=False):
+        """Get text elements in a region of the figure.
+
+        :param Rect rect: Region to read.
+        :param int padding: Padding to add to text element bounding boxes.
+        :param RIL level: Deepest level of text elements to get (see get_text).
+        :param bool light: Whether to get only the text, bounding box and confidence of each element (see get_text).
+        :return: List of text blocks.
+        :rtype: list[TextBlock]
+        """
+        left, top = max(rect.left - self.margin, 0), max(rect.top - self.margin, 0)
+        right, bottom = min(rect.right + self.margin, self.width), min(rect.bottom + self.margin, self.height)
+        if right <= left or bottom <= top:
+            return []
+
+        self.api.SetRectangle(left, top, right - left, bottom - top)
+        return recognize(self.api, padding=padding, level=level, light=light)
+
+    def close(self):
+        """ Releases the image and results, keeping the trained data loaded for the next session."""
+        self.api.Clear()
+        if getattr(_api_pool, 'session', None) is self:
+            _api_pool.session = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
 def get_words(blocks):
     """Convert list of text blocks into a flat list of the contained words.
 
@@ -213,7 +361,8 @@ def get_sentences(blocks):
     return sentences
 
 
-def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=None, img_orientation=None):
+def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=None, img_orientation=None,
+             level=RIL.SYMBOL, light=False):
     """Get text elements in image.
 
     When passing a cropped image to this function, use ``x_offset`` and ``y_offset`` to ensure the coordinate positions
@@ -226,6 +375,10 @@ def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=Non
     :param int padding: Padding to add to text element bounding boxes.
     :param string whitelist: String containing allowed characters. e.g. Use '0123456789' for digits.
     :param Orientation img_orientation: Main orientation of text in image, if known.
+    :param RIL level: Deepest level of text elements to get. Elements below this level are not read, eg. words have no
+                      symbols when level is RIL.WORD.
+    :param bool light: Whether to get only the text, bounding box and confidence of each element. Orientation,
+                       paragraph, font and symbol properties are left as None.
     :return: List of text blocks.
     :rtype: list[TextBlock]
     """
@@ -242,7 +395,7 @@ def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=Non
         npad = ((img_padding, img_padding), (img_padding, img_padding))
     else:
         raise ValueError('Unexpected image dimensions')
-    img = np.pad(img, pad_width=npad, mode='constant', constant_values=1)
+    img = np.pad(img, pad_width=npad, mode='constant', constant_values=white(img))
     shape = img.shape
 
     # Rotate img before sending to tesseract if an img_orientation has been given
@@ -253,73 +406,109 @@ def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=Non
     elif img_orientation is not None:
         raise NotImplementedError('Unsupported img_orientation')
 
+    api = get_api(psm, whitelist)
+    try:
+        # Convert image to PIL to load into tesseract (suppress precision loss warning)
+        with warnings.catch_warnings(record=True) as ws:
+            pil_img = io.img_as_pil(img)
+        api.SetImage(pil_img)
+        # TODO: api.SetSourceResolution if we want correct pointsize on output?
+        blocks = recognize(api, x_offset - img_padding, y_offset - img_padding, padding, img_orientation, shape,
+                           level, light)
+    finally:
+        # Release the image and results, keeping the trained data loaded for the next call
+        api.Clear()
+    return blocks
+
+
+def recognize(api, x_offset=0, y_offset=0, padding=0, img_orientation=None, shape=None, level=RIL.SYMBOL,
+              light=False):
+    """Recognize the image set on a Tesseract API, and get its text elements.
+
+    :param tesserocr.PyTessBaseAPI api: Tesseract API with an image set.
+    :param int x_offset: Offset to add to the horizontal coordinates of the returned text elements.
+    :param int y_offset: Offset to add to the vertical coordinates of the returned text elements.
+    :param int padding: Padding to add to text element bounding boxes.
+    :param Orientation img_orientation: Orientation the image was rotated from before it was set, if any.
+    :param tuple shape: Shape of the image before it was rotated. Required if img_orientation is given.
+    :param RIL level: Deepest level of text elements to get (see get_text).
+    :param bool light: Whether to get only the text, bounding box and confidence of each element (see get_text).
+    :return: List of text blocks.
+    :rtype: list[TextBlock]
+    """
+
     def _get_common_props(it, ril):
         """Get the properties that apply to all text elements."""
         # Important: Call GetUTF8Text() before Orientation(). Former raises RuntimeError if no text, latter Segfaults.
         text = it.GetUTF8Text(ril)
-        orientation, writing_direction, textline_order, deskew_angle = it.Orientation()
         bb = it.BoundingBox(ril, padding=padding)
 
+        if light:
+            orientation = writing_direction = textline_order = deskew_angle = None
+        else:
+            orientation, writing_direction, textline_order, deskew_angle = it.Orientation()
+            orientation = Orientation(orientation)
+            writing_direction = WritingDirection(writing_direction)
+            textline_order = TextlineOrder(textline_order)
+
         # Translate bounding box and orientation if img was previously rotated
         if img_orientation == Orientation.PAGE_LEFT:
-            orientation = {
-                Orientation.PAGE_UP: Orientation.PAGE_LEFT,
-                Orientation.PAGE_LEFT: Orientation.PAGE_DOWN,
-                Orientation.PAGE_DOWN: Orientation.PAGE_RIGHT,
-                Orientation.PAGE_RIGHT: Orientation.PAGE_UP
-            }[orientation]
+            if orientation is not None:
+                orientation = {
+                    Orientation.PAGE_UP: Orientation.PAGE_LEFT,
+                    Orientation.PAGE_LEFT: Orientation.PAGE_DOWN,
+                    Orientation.PAGE_DOWN: Orientation.PAGE_RIGHT,
+                    Orientation.PAGE_RIGHT: Orientation.PAGE_UP
+                }[orientation]
             left, right, top, bottom = bb[1], bb[3], shape[0] - bb[2], shape[0] - bb[0]
         elif img_orientation == Orientation.PAGE_RIGHT:
-            orientation = {
-                Orientation.PAGE_UP: Orientation.PAGE_RIGHT,
-                Orientation.PAGE_LEFT: Orientation.PAGE_UP,
-                Orientation.PAGE_DOWN: Orientation.PAGE_LEFT,
-                Orientation.PAGE_RIGHT: Orientation.PAGE_DOWN
-            }[orientation]
+            if orientation is not None:
+                orientation = {
+                    Orientation.PAGE_UP: Orientation.PAGE_RIGHT,
+                    Orientation.PAGE_LEFT: Orientation.PAGE_UP,
+                    Orientation.PAGE_DOWN: Orientation.PAGE_LEFT,
+                    Orientation.PAGE_RIGHT: Orientation.PAGE_DOWN
+                }[orientation]
             left, right, top, bottom = shape[1] - bb[3], shape[1] - bb[1], bb[0], bb[2]
         else:
             left, right, top, bottom = bb[0], bb[2], bb[1], bb[3]
 
         common_props = {
             'text': text,
-            'left': left + x_offset - img_padding,
-            'right': right + x_offset - img_padding,
-            'top': top + y_offset - img_padding,
-            'bottom': bottom + y_offset - img_padding,
+            'left': left + x_offset,
+            'right': right + x_offset,
+            'top': top + y_offset,
+            'bottom': bottom + y_offset,
             'confidence': it.Confidence(ril),
-            'orientation': Orientation(orientation),  # TODO
-            'writing_direction': WritingDirection(writing_direction),
-            'textline_order': TextlineOrder(textline_order),
+            'orientation': orientation,  # TODO
+            'writing_direction': writing_direction,
+            'textline_order': textline_order,
             'deskew_angle': deskew_angle
         }
         return common_props
 
     blocks = []
-    with tesserocr.PyTessBaseAPI(psm=psm) as api:
-        # Convert image to PIL to load into tesseract (suppress precision loss warning)
-        with warnings.catch_warnings(record=True) as ws:
-            pil_img = io.img_as_pil(img)
-        api.SetImage(pil_img)
-        if whitelist is not None:
-            api.SetVariable('tessedit_char_whitelist', whitelist)
-        # TODO: api.SetSourceResolution if we want correct pointsize on output?
-        api.Recognize()
-        it = api.GetIterator()
-        block = None
-        para = None
-        line = None
-        word = None
-        it.Begin()
-
-        while True:
-            try:
-                if it.IsAtBeginningOf(RIL.BLOCK):
-                    common_props = _get_common_props(it, RIL.BLOCK)
-                    block = TextBlock(**common_props)
-                    blocks.append(block)
-
-                if it.IsAtBeginningOf(RIL.PARA):
-                    common_props = _get_common_props(it, RIL.PARA)
+    api.Recognize()
+    it = api.GetIterator()
+    block = None
+    para = None
+    line = None
+    word = None
+    it.Begin()
+
+    while True:
+        try:
+            if it.IsAtBeginningOf(RIL.BLOCK):
+                common_props = _get_common_props(it, RIL.BLOCK)
+                block = TextBlock(**common_props)
+                blocks.append(block)
+
+            if level >= RIL.PARA and it.IsAtBeginningOf(RIL.PARA):
+                common_props = _get_common_props(it, RIL.PARA)
+                if light:
+                    para = TextParagraph(is_ltr=None, justification=None, is_list_item=None, is_crown=None,
+                                         first_line_indent=None, **common_props)
+                else:
                     justification, is_list_item, is_crown, first_line_indent = it.ParagraphInfo()
                     para = TextParagraph(
                         is_ltr=it.ParagraphIsLtr(),
@@ -329,17 +518,20 @@ def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=Non
                         first_line_indent=first_line_indent,
                         **common_props
                     )
-                    if block is not None:
-                        block.paragraphs.append(para)
-
-                if it.IsAtBeginningOf(RIL.TEXTLINE):
-                    common_props = _get_common_props(it, RIL.TEXTLINE)
-                    line = TextLine(**common_props)
-                    if para is not None:
-                        para.lines.append(line)
-
-                if it.IsAtBeginningOf(RIL.WORD):
-                    common_props = _get_common_props(it, RIL.WORD)
+                if block is not None:
+                    block.paragraphs.append(para)
+
+            if level >= RIL.TEXTLINE and it.IsAtBeginningOf(RIL.TEXTLINE):
+                common_props = _get_common_props(it, RIL.TEXTLINE)
+                line = TextLine(**common_props)
+                if para is not None:
+                    para.lines.append(line)
+
+            if level >= RIL.WORD and it.IsAtBeginningOf(RIL.WORD):
+                common_props = _get_common_props(it, RIL.WORD)
+                if light:
+                    word = TextWord(language=None, from_dictionary=None, numeric=None, **common_props)
+                else:
                     wfa = it.WordFontAttributes()
                     if wfa:
                         common_props.update(wfa)
@@ -349,24 +541,28 @@ def get_text(img, x_offset=0, y_offset=0, psm=PSM.AUTO, padding=0, whitelist=Non
                         numeric=it.WordIsNumeric(),
                         **common_props
                     )
-                    if line is not None:
-                        line.words.append(word)
+                if line is not None:
+                    line.words.append(word)
 
+            if level >= RIL.SYMBOL:
                 # Beware: Character level coordinates do not seem to be accurate in Tesseact 4!!
                 common_props = _get_common_props(it, RIL.SYMBOL)
-                symbol = TextSymbol(
-                    is_dropcap=it.SymbolIsDropcap(),
-                    is_subscript=it.SymbolIsSubscript(),
-                    is_superscript=it.SymbolIsSuperscript(),
-                    **common_props
-                )
+                if light:
+                    symbol = TextSymbol(is_dropcap=None, is_subscript=None, is_superscript=None, **common_props)
+                else:
+                    symbol = TextSymbol(
+                        is_dropcap=it.SymbolIsDropcap(),
+                        is_subscript=it.SymbolIsSubscript(),
+                        is_superscript=it.SymbolIsSuperscript(),
+                        **common_props
+                    )
                 word.symbols.append(symbol)
-            except RuntimeError as e:
-                # Happens if no text was detected
-                log.info(e)
+        except RuntimeError as e:
+            # Happens if no text was detected
+            log.info(e)
 
-            if not it.Next(RIL.SYMBOL):
-                break
+        if not it.Next(level):
+            break
     return blocks
 
 
@@ -25,9 +25,9 @@ from . import io
 from . import actions
 from .model import RGroup
 from .ocr import ASSIGNMENT, SEPERATORS, CONCENTRATION
+from .utils import pad_white
 
 import re
-from skimage.util import pad
 from urllib.error import URLError
 
 from chemdataextractor.doc.text import Token
@@ -300,11 +300,10 @@ def get_rgroup_smiles(diag, extension='jpg', debug=False, superatom_path=superat
     """
 
     # Add some padding to image to help resolve characters on the edge
-    padded_img = pad(diag.fig.img, ((5, 5), (5, 5), (0, 0)), mode='constant', constant_values=1)
+    padded_img = pad_white(diag.fig.img, 5)
 
     # Save a temp image
-    img_name = 'r_group_temp.' + extension
-    io.imsave(img_name, padded_img)
+    img_name = io.imsave_temp(padded_img, extension, prefix='r_group_temp_')
 
     osra_input = []
     label_cands = []
@@ -331,6 +330,8 @@ def get_rgroup_smiles(diag, extension='jpg', debug=False, superatom_path=superat
 
     if not debug:
         io.imdel(img_name)
+    else:
+        log.debug('Kept OSRA input image %s' % img_name)
 
     smiles = [actions.clean_output(smile) for smile in smiles]
 
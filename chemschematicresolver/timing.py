@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Timing
+======
+
+Lightweight instrumentation of the time spent in each extraction stage.
+
+author: Ed Beard
+email: ejb207@cam.ac.uk
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import collections
+import time
+
+log = logging.getLogger(__name__)
+
+
+class StageTimer(object):
+    """ Records the wall time and CPU time spent in each named stage.
+
+    Stages entered more than once (eg. 'read_label', once per label) accumulate their times and call counts.
+    """
+
+    def __init__(self, callback=None):
+        """
+
+        :param callback: Function called as callback(stage, wall, cpu) each time a stage finishes (optional)
+        """
+        self.timings = collections.OrderedDict()
+        self.callback = callback
+
+    def stage(self, name):
+        """ Returns a context manager timing the enclosed block as stage 'name'."""
+        return _Stage(self, name)
+
+    def add(self, name, wall, cpu):
+        """ Adds a measured time to stage 'name'."""
+
+        if name not in self.timings:
+            self.timings[name] = {'wall': 0., 'cpu': 0., 'calls': 0}
+
+        entry = self.timings[name]
+        entry['wall'] += wall
+        entry['cpu'] += cpu
+        entry['calls'] += 1
+
+        if self.callback is not None:
+            self.callback(name, wall, cpu)
+
+    def __repr__(self):
+        return '<%s: %s>' % (self.__class__.__name__, dict(self.timings))
+
+    def __str__(self):
+        return '<%s: %s>' % (self.__class__.__name__, dict(self.timings))
+
+
+class _Stage(object):
+    """ Context manager measuring one execution of a stage."""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.timer.add(self.name, time.perf_counter() - self.wall_start, time.process_time() - self.cpu_start)
+        return False
+
+
+class NullTimer(object):
+    """ Timer that records nothing. Used when instrumentation is disabled."""
+
+    def stage(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+# Shared instance used when no timer is given
+NULL_TIMER = NullTimer()
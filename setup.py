@@ -29,6 +29,7 @@ setup(
     tests_require=['pytest'],
     install_requires=[
         'pillow', 'tesserocr', 'matplotlib==2.2.4', 'scikit-learn', 'scikit-image<0.15', 'numpy', 'scipy',
+        'threadpoolctl',
     ],
     classifiers=[
         'Intended Audience :: Developers',
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+bench_stages
+========
+
+Benchmarks of the individual extraction stages on synthetic schematic figures.
+
+Each stage is timed separately while the image size or the panel count of the synthetic figures is varied, and the
+resulting scaling curves are plotted. Peak memory of each image dtype policy, and the time and memory of decoding large
+JPEGs with and without a pixel budget, are also measured. Run as a script:
+
+    python bench_stages.py --output bench_results
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import argparse
+import copy
+import csv
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from matplotlib import pyplot as plt
+
+import chemschematicresolver as csr
+from synthetic import make_schematic
+
+log = logging.getLogger(__name__)
+
+PANEL_SIZES = [150, 300, 600, 1200]
+PANEL_COUNTS = [2, 4, 8, 16, 32]
+CLOSING_KERNELS = [4, 6, 10, 15]
+STAGES = ['segment', 'classify', 'merge_label_horizontally', 'label_diags', 'get_text', 'read_diagram_pyosra']
+MEMORY_PANEL_SIZES = [300, 600, 1200, 2400]
+DECODE_MAX_PIXELS = [None, 4000000, 1000000]
+
+
+def time_call(func, *args, **kwargs):
+    """ Returns the minimum wall time of func over repeated calls, and the result of the last call.
+
+    If a setup function is given, it is called before each call outside of the timed region, and its result is passed
+    to func as the first argument.
+    """
+
+    repeat = kwargs.pop('repeat', 3)
+    setup = kwargs.pop('setup', None)
+    best = float('inf')
+    for i in range(repeat):
+        call_args = args if setup is None else (setup(),) + args
+        start = time.perf_counter()
+        result = func(*call_args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_figure(fig, repeat=3, osra=True):
+    """ Times each stage of the pipeline on a figure.
+
+    Each stage is given the outputs of the previous stage, computed once outside of the timed region. Figures cache
+    the images derived from them, so each repeat of segmentation is given a fresh copy of the figure. Later stages are
+    given the figure as segmentation leaves it, as in the pipeline.
+
+    :return: Dictionary of stage name to wall time in seconds
+    """
+
+    timings = {}
+
+    timings['segment'], panels = time_call(csr.actions.segment, setup=fig.copy, repeat=repeat)
+    panels = csr.actions.segment(fig)
+    timings['classify'], (labels, diags) = time_call(
+        csr.actions.get_labels_and_diagrams_k_means_clustering, panels, fig, repeat=repeat)
+
+    # Merging re-orders its input, so each repeat is given a fresh copy
+    timings['merge_label_horizontally'], merged = time_call(
+        lambda: csr.actions.merge_label_horizontally(copy.deepcopy(labels), fig), repeat=repeat)
+    labels = csr.actions.convert_panels_to_labels(merged)
+
+    timings['label_diags'], labelled_diags = time_call(
+        lambda: csr.actions.label_diags(labels, copy.deepcopy(diags), fig.get_bounding_box()), repeat=repeat)
+
+    label = max(labels, key=lambda l: l.area)
+    label_img = csr.utils.crop(csr.utils.convert_greyscale(fig.img), label.left, label.right, label.top, label.bottom)
+    timings['get_text'], text = time_call(
+        csr.ocr.get_text, label_img, psm=csr.ocr.PSM.SINGLE_BLOCK, whitelist=csr.ocr.LABEL_WHITELIST, repeat=repeat)
+
+    if osra:
+        diag = max(diags, key=lambda d: d.area)
+        diag.fig = csr.model.Figure(csr.utils.crop(fig.img, diag.left, diag.right, diag.top, diag.bottom))
+        timings['read_diagram_pyosra'], smile = time_call(csr.actions.read_diagram_pyosra, diag, repeat=repeat)
+
+    return timings
+
+
+def bench_image_size(panel_sizes=PANEL_SIZES, n_panels=6, repeat=3, osra=True):
+    """ Times each stage against the image size, at a fixed panel count."""
+
+    results = []
+    for panel_size in panel_sizes:
+        fig, _, _ = make_schematic(n_panels=n_panels, panel_size=panel_size, label_height=panel_size // 12)
+        timings = bench_figure(fig, repeat=repeat, osra=osra)
+        timings['pixels'] = fig.img.shape[0] * fig.img.shape[1]
+        log.info('Panel size %s : %s' % (panel_size, timings))
+        results.append(timings)
+    return results
+
+
+def bench_panel_count(panel_counts=PANEL_COUNTS, panel_size=300, repeat=3, osra=True):
+    """ Times each stage against the number of diagram-label pairs, at a fixed panel size."""
+
+    results = []
+    for n_panels in panel_counts:
+        fig, _, _ = make_schematic(n_panels=n_panels, panel_size=panel_size, columns=4)
+        timings = bench_figure(fig, repeat=repeat, osra=osra)
+        timings['panels'] = n_panels
+        log.info('Panel count %s : %s' % (n_panels, timings))
+        results.append(timings)
+    return results
+
+
+def bench_closing(panel_sizes=PANEL_SIZES, kernels=CLOSING_KERNELS, repeat=3):
+    """ Times morphological closing by distance transform against closing by disk structuring element.
+
+    The closed images are checked to be identical for every image size and kernel size.
+    """
+
+    results = []
+    for panel_size in panel_sizes:
+        fig, _, _ = make_schematic(n_panels=6, panel_size=panel_size, label_height=panel_size // 12)
+        binary = fig.binary
+
+        for kernel in kernels:
+            timings = {'pixels': binary.size, 'kernel': kernel}
+            closed = {}
+            for method in ['edt', 'disk']:
+                timings[method], closed_fig = time_call(
+                    lambda: csr.utils.binary_close(csr.model.Figure(binary), size=kernel, method=method),
+                    repeat=repeat)
+                closed[method] = closed_fig.img
+
+            if not (closed['edt'] == closed['disk']).all():
+                raise AssertionError('Closing methods differ for kernel %s at panel size %s' % (kernel, panel_size))
+            log.info('Closing panel size %s, kernel %s : %s' % (panel_size, kernel, timings))
+            results.append(timings)
+    return results
+
+
+def plot_closing(results, output_path):
+    """ Plots closing time against image size for each method and kernel size."""
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    for kernel in sorted(set(result['kernel'] for result in results)):
+        kernel_results = [result for result in results if result['kernel'] == kernel]
+        xs = [result['pixels'] for result in kernel_results]
+        ax.plot(xs, [result['edt'] for result in kernel_results], marker='o', label='edt, disk(%s)' % kernel)
+        ax.plot(xs, [result['disk'] for result in kernel_results], marker='x', linestyle='--',
+                label='binary_closing, disk(%s)' % kernel)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Image size (pixels)')
+    ax.set_ylabel('Wall time (s)')
+    ax.legend()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+
+def peak_rss():
+    """ Returns the peak resident set size of this process in MB.
+
+    VmHWM is read where available, as on Linux ru_maxrss carries over the RSS of the parent process when a
+    subprocess is started.
+    """
+
+    try:
+        with open('/proc/self/status') as inf:
+            for line in inf:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.
+    except IOError:
+        pass
+
+    # ru_maxrss is in kB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024. ** 2 if sys.platform == 'darwin' else maxrss / 1024.
+
+
+def measure_memory(path, dtype):
+    """ Reads, segments and classifies an image file in this process, then returns the peak RSS in MB.
+
+    A dtype of 'none' returns the peak RSS after imports only, as a baseline.
+    """
+
+    if dtype != 'none':
+        fig = csr.io.imread(path, dtype=dtype)
+        panels = csr.actions.segment(fig)
+        labels, diags = csr.actions.classify_kmeans(panels, fig)
+        for diag in csr.actions.remove_diag_pixel_islands(diags, fig):
+            csr.utils.pad_white(diag.fig.img, 5)
+    return peak_rss()
+
+
+def bench_memory(panel_sizes=MEMORY_PANEL_SIZES, dtypes=csr.io.DTYPES):
+    """ Measures the peak RSS of each image dtype policy against the image size.
+
+    Each measurement runs in a fresh subprocess, so that peaks of earlier measurements are not carried over.
+    """
+
+    results = []
+    temp_dir = tempfile.mkdtemp()
+    for panel_size in panel_sizes:
+        fig, _, _ = make_schematic(n_panels=6, panel_size=panel_size, label_height=panel_size // 12)
+        path = os.path.join(temp_dir, 'schematic_%s.png' % panel_size)
+        csr.io.imsave(path, fig.img)
+        result = {'pixels': fig.img.shape[0] * fig.img.shape[1]}
+        del fig
+
+        for dtype in ['none'] + list(dtypes):
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--memory', path, dtype])
+            result[dtype] = float(output.split()[-1])
+        log.info('Memory panel size %s : %s' % (panel_size, result))
+        results.append(result)
+        os.remove(path)
+
+    os.rmdir(temp_dir)
+    return results
+
+
+def measure_decode(path, dtype, max_pixels):
+    """ Reads an image file in this process, then returns the wall time and the peak RSS above the baseline in MB."""
+
+    baseline = peak_rss()
+    start = time.perf_counter()
+    csr.io.imread(path, dtype=dtype, max_pixels=max_pixels)
+    return time.perf_counter() - start, peak_rss() - baseline
+
+
+def bench_decode(panel_size=2400, max_pixels_list=DECODE_MAX_PIXELS, dtypes=csr.io.DTYPES):
+    """ Measures the time and peak RSS of reading a large JPEG with and without a pixel budget.
+
+    Each measurement runs in a fresh subprocess, so that peaks of earlier measurements are not carried over.
+    """
+
+    fig, _, _ = make_schematic(n_panels=6, panel_size=panel_size, label_height=panel_size // 12)
+    temp_dir = tempfile.mkdtemp()
+    path = os.path.join(temp_dir, 'schematic_%s.jpg' % panel_size)
+    csr.io.imsave(path, fig.img)
+    pixels = fig.img.shape[0] * fig.img.shape[1]
+    del fig
+
+    results = []
+    for dtype in dtypes:
+        for max_pixels in max_pixels_list:
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--decode', path, dtype,
+                                              str(max_pixels or 0)])
+            seconds, peak = [float(value) for value in output.split()[-2:]]
+            result = {'pixels': pixels, 'dtype': dtype, 'max_pixels': max_pixels or pixels, 'time': seconds,
+                      'peak_rss': peak}
+            log.info('Decode : %s' % result)
+            results.append(result)
+
+    os.remove(path)
+    os.rmdir(temp_dir)
+    return results
+
+
+def plot_memory(results, dtypes, output_path):
+    """ Plots peak RSS above the import baseline against image size, for each dtype policy."""
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    xs = [result['pixels'] for result in results]
+    for dtype in dtypes:
+        ax.plot(xs, [result[dtype] - result['none'] for result in results], marker='o', label=dtype)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('Image size (pixels)')
+    ax.set_ylabel('Peak RSS above baseline (MB)')
+    ax.legend()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+
+def plot_scaling(results, x_key, x_label, output_path):
+    """ Plots the time of each stage against a varied parameter, on log-log axes."""
+
+    fig, ax = plt.subplots(figsize=(8, 6))
+    xs = [result[x_key] for result in results]
+    for stage in STAGES:
+        if all(stage in result for result in results):
+            ax.plot(xs, [result[stage] for result in results], marker='o', label=stage)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel(x_label)
+    ax.set_ylabel('Wall time (s)')
+    ax.legend()
+    fig.savefig(output_path)
+    plt.close(fig)
+
+
+def write_csv(results, output_path):
+    """ Writes benchmark results to a csv file."""
+
+    fieldnames = sorted(set(key for result in results for key in result))
+    with open(output_path, 'w') as outf:
+        writer = csv.DictWriter(outf, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ChemSchematicResolver stages on synthetic figures.')
+    parser.add_argument('--output', default='bench_results', help='Directory to write csv files and plots to')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timed repeats per stage')
+    parser.add_argument('--no-osra', action='store_true', help='Skip timing of the OSRA stage')
+    parser.add_argument('--memory', nargs=2, metavar=('PATH', 'DTYPE'), help=argparse.SUPPRESS)
+    parser.add_argument('--decode', nargs=3, metavar=('PATH', 'DTYPE', 'MAX_PIXELS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Single memory measurements, run in a subprocess by bench_memory and bench_decode
+    if args.memory:
+        print(measure_memory(*args.memory))
+        return
+    if args.decode:
+        path, dtype, max_pixels = args.decode
+        print('%s %s' % measure_decode(path, dtype, int(max_pixels) or None))
+        return
+
+    if not os.path.exists(args.output):
+        os.makedirs(args.output)
+
+    size_results = bench_image_size(repeat=args.repeat, osra=not args.no_osra)
+    write_csv(size_results, os.path.join(args.output, 'image_size.csv'))
+    plot_scaling(size_results, 'pixels', 'Image size (pixels)', os.path.join(args.output, 'image_size.png'))
+
+    count_results = bench_panel_count(repeat=args.repeat, osra=not args.no_osra)
+    write_csv(count_results, os.path.join(args.output, 'panel_count.csv'))
+    plot_scaling(count_results, 'panels', 'Number of panels', os.path.join(args.output, 'panel_count.png'))
+
+    closing_results = bench_closing(repeat=args.repeat)
+    write_csv(closing_results, os.path.join(args.output, 'closing.csv'))
+    plot_closing(closing_results, os.path.join(args.output, 'closing.png'))
+
+    memory_results = bench_memory()
+    write_csv(memory_results, os.path.join(args.output, 'memory.csv'))
+    plot_memory(memory_results, csr.io.DTYPES, os.path.join(args.output, 'memory.png'))
+
+    decode_results = bench_decode()
+    write_csv(decode_results, os.path.join(args.output, 'decode.csv'))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+synthetic
+========
+
+Generator of synthetic chemical schematic figures, used for reproducible benchmarks.
+
+Figures contain a grid of structure-like line drawings (rings with substituent bonds), each with a text label
+centred below it. Image size, panel count and label size are all controlled, and the layout is deterministic for a
+given seed.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import math
+import random
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+from skimage import img_as_float
+
+import chemschematicresolver as csr
+
+log = logging.getLogger(__name__)
+
+FONT_NAMES = ['DejaVuSans.ttf', 'Arial.ttf', 'LiberationSans-Regular.ttf']
+
+
+def load_font(size):
+    """ Loads a scalable font of the given pixel size, falling back to PIL's default bitmap font."""
+
+    for font_name in FONT_NAMES:
+        try:
+            return ImageFont.truetype(font_name, size)
+        except (IOError, OSError):
+            continue
+    log.warning('No scalable font found - label sizes will not be controlled')
+    return ImageFont.load_default()
+
+
+def draw_structure(draw, cx, cy, radius, line_width, rng):
+    """ Draws a structure-like diagram: a hexagonal ring, an optional fused ring and some substituent bonds.
+
+    :return: Bounding box of the drawing as (left, right, top, bottom)
+    """
+
+    def ring(x, y):
+        points = [(x + radius * math.cos(math.pi / 6 + i * math.pi / 3),
+                   y + radius * math.sin(math.pi / 6 + i * math.pi / 3)) for i in range(6)]
+        draw.line(points + [points[0]], fill=0, width=line_width)
+        return points
+
+    points = ring(cx, cy)
+    all_points = list(points)
+
+    # Fused second ring on the right hand side
+    if rng.random() < 0.5:
+        all_points.extend(ring(cx + radius * math.sqrt(3), cy))
+
+    # Substituent bonds radiating outwards from the first ring
+    for x, y in rng.sample(points, 3):
+        angle = math.atan2(y - cy, x - cx)
+        end = (x + 0.8 * radius * math.cos(angle), y + 0.8 * radius * math.sin(angle))
+        draw.line([(x, y), end], fill=0, width=line_width)
+        all_points.append(end)
+
+    xs, ys = [p[0] for p in all_points], [p[1] for p in all_points]
+    return int(min(xs)), int(max(xs)), int(min(ys)), int(max(ys))
+
+
+def make_schematic(n_panels=6, panel_size=300, label_height=24, columns=3, seed=0):
+    """ Creates a synthetic schematic figure.
+
+    :param int n_panels: Number of diagram-label pairs.
+    :param int panel_size: Width and height of the grid cell holding each pair, in pixels.
+    :param int label_height: Font size of the labels, in pixels.
+    :param int columns: Number of grid columns.
+    :param int seed: Random seed controlling the drawings and label text.
+
+    :return: Figure, with the ground truth diagram and label bounding boxes
+    :rtype: tuple(Figure, list[Rect], list[Rect])
+    """
+
+    rng = random.Random(seed)
+    rows = int(math.ceil(n_panels / columns))
+    width, height = columns * panel_size, rows * panel_size
+
+    img = Image.new('L', (width, height), color=255)
+    draw = ImageDraw.Draw(img)
+    font = load_font(label_height)
+    line_width = max(1, panel_size // 150)
+
+    diags, labels = [], []
+    for i in range(n_panels):
+        row, col = divmod(i, columns)
+        cx = col * panel_size + panel_size * 0.35
+        cy = row * panel_size + panel_size * 0.4
+        radius = panel_size * 0.15
+
+        left, right, top, bottom = draw_structure(draw, cx, cy, radius, line_width, rng)
+        diags.append(csr.model.Rect(left, right, top, bottom))
+
+        text = '%s%s' % (i + 1, rng.choice('abcd'))
+        text_left = col * panel_size + panel_size * 0.3
+        text_top = row * panel_size + panel_size * 0.78
+        draw.text((text_left, text_top), text, fill=0, font=font)
+        l, t, r, b = draw.textbbox((text_left, text_top), text, font=font)
+        labels.append(csr.model.Rect(int(l), int(r), int(t), int(b)))
+
+    fig = csr.model.Figure(img_as_float(np.stack([np.asarray(img)] * 3, axis=-1)))
+    return fig, diags, labels
@@ -31,6 +31,7 @@ tests_dir = os.path.dirname(os.path.abspath(__file__))
 train_dir = os.path.join(os.path.dirname(tests_dir), 'train')
 markush_dir = os.path.join(train_dir, 'train_markush_small')
 sample_diag = os.path.join(markush_dir, 'S014372081630119X_gr1.jpg')
+data_dir = os.path.join(tests_dir, 'data')
 
 class TestActions(unittest.TestCase):
 
@@ -129,3 +130,136 @@ class TestActions(unittest.TestCase):
             ax2.add_patch(diag_rect)
 
         plt.show()
+
+    def test_two_means_1d(self):
+        ''' Tests the exact 1D 2-means split against a brute force search'''
+
+        values = numpy.array([0.010, 0.012, 0.031, 0.009, 0.028, 0.011, 0.030])
+        cluster_labels = csr.actions.two_means_1d(values)
+        self.assertEqual(list(cluster_labels), [0, 0, 1, 0, 1, 0, 1])
+
+        # Identical values cannot be split
+        self.assertEqual(list(csr.actions.two_means_1d([5, 5, 5])), [0, 0, 0])
+
+    def test_two_means_1d_deterministic(self):
+        rng = numpy.random.RandomState(0)
+        values = rng.rand(40)
+        first = csr.actions.two_means_1d(values)
+        for i in range(5):
+            self.assertEqual(list(csr.actions.two_means_1d(values)), list(first))
+
+    def test_segment_downscaled(self):
+        ''' Tests segmentation at reduced resolution finds the same panels as at full resolution'''
+
+        fig = csr.io.imread(os.path.join(data_dir, 'S014372081630122X_gr1.jpg'))
+        full_panels = csr.actions.segment(copy.deepcopy(fig))
+        pixel_budget = fig.img.shape[0] * fig.img.shape[1] // 8
+
+        # Panel edges found at 1 / sqrt(8) resolution are only accurate to about one downscaled pixel either side
+        tolerance = 4
+        downscaled_panels = csr.actions.segment(copy.deepcopy(fig), pixel_budget=pixel_budget)
+
+        def bboxes(panels):
+            return sorted((p.left, p.right, p.top, p.bottom) for p in panels)
+
+        self.assertEqual(len(full_panels), len(downscaled_panels))
+        for full, downscaled in zip(bboxes(full_panels), bboxes(downscaled_panels)):
+            for full_edge, downscaled_edge in zip(full, downscaled):
+                self.assertLessEqual(abs(full_edge - downscaled_edge), tolerance)
+
+    def test_remove_diag_pixel_islands(self):
+        ''' Tests islands are blanked from the diagram image, using the panel regions found by segmentation'''
+
+        img = numpy.ones((200, 200, 3))
+        img[40:120, 40:120] = 0  # Diagram
+        img[150:156, 150:156] = 0  # Island inside the diagram bounding box
+        fig = csr.model.Figure(img)
+
+        csr.actions.segment(fig)
+        self.assertIsNotNone(fig.panel_tags)
+
+        diag = csr.model.Diagram(30, 170, 30, 170, 0)
+        diags = csr.actions.remove_diag_pixel_islands([diag], fig)
+
+        self.assertTrue((diags[0].fig.img[120:, 120:] == 1).all())
+        self.assertTrue((diags[0].fig.img[10:90, 10:90] == 0).all())
+        self.assertTrue((fig.img[150:156, 150:156] == 0).all())  # Original figure is unchanged
+
+    def test_get_candidate_pairs(self):
+        ''' Tests candidate pairs are those within reach, in combinations order'''
+
+        panels = [csr.model.Panel(100, 110, 0, 10), csr.model.Panel(0, 10, 0, 10), csr.model.Panel(15, 25, 0, 10),
+                  csr.model.Panel(30, 40, 0, 10)]
+        pairs = csr.actions.get_candidate_pairs(panels, lambda panel: panel.left,
+                                                lambda panel: (panel.right, panel.right + 2 * panel.height))
+        self.assertEqual(pairs, [(1, 2), (1, 3), (2, 3)])
+
+    def test_merge_all_overlaps(self):
+        ''' Tests merging continues until no panels overlap, including overlaps created by earlier merges'''
+
+        untouched = csr.model.Panel(200, 210, 200, 210)
+        panels = [csr.model.Panel(0, 10, 0, 10), untouched, csr.model.Panel(5, 20, 5, 12),
+                  csr.model.Panel(15, 30, 0, 3)]  # Overlaps the merge of the first and third panels only
+        merged, done = csr.actions.merge_all_overlaps(panels)
+
+        self.assertTrue(done)
+        self.assertEqual(len(merged), 2)
+        self.assertIs(merged[0], untouched)
+        self.assertEqual((merged[1].left, merged[1].right, merged[1].top, merged[1].bottom), (0, 30, 0, 12))
+        self.assertEqual([panel.tag for panel in merged], [0, 1])
+
+    def test_assign_labels_to_diags(self):
+        ''' Tests labels are assigned from the number of expansions needed to reach them'''
+
+        fig_bbox = csr.model.Panel(0, 200, 0, 200)
+        near, far = csr.model.Label(50, 60, 30, 40), csr.model.Label(100, 110, 50, 60)
+        empty = csr.model.Label(20, 20, 20, 30)  # Zero width, so never reached
+
+        diag = csr.model.Diagram(40, 80, 50, 90)
+        csr.actions.assign_labels_to_diags([diag], [far, near, empty], fig_bbox)
+        self.assertIs(diag.label, near)
+
+        # Labels reached on the same expansion go to the last label, matching the expanding probe
+        tied = csr.model.Label(50, 60, 100, 110)
+        csr.actions.assign_labels_to_diags([diag], [near, tied], fig_bbox)
+        self.assertIs(diag.label, tied)
+
+        # Only labels in the given direction are considered, and ties go to the first label
+        diag.label = None
+        csr.actions.assign_labels_to_diags_postprocessing([diag], [near, tied, far], 'S', fig_bbox)
+        self.assertIs(diag.label, tied)
+        csr.actions.assign_labels_to_diags_postprocessing([diag], [far, near, tied], 'N', fig_bbox)
+        self.assertIs(diag.label, near)
+
+        # The expansion stops at the edge of the figure
+        diag.label = None
+        csr.actions.assign_labels_to_diags_postprocessing([diag], [tied], 'S', csr.model.Panel(0, 200, 0, 95))
+        self.assertIsNone(diag.label)
+
+    def test_label_diags_assignment(self):
+        ''' Tests diagrams and labels are paired together, even where a label is nearest to two diagrams'''
+
+        fig_bbox = csr.model.Panel(0, 300, 0, 200)
+        diags = [csr.model.Diagram(0, 100, 0, 100, 0), csr.model.Diagram(120, 220, 0, 100, 1),
+                 csr.model.Diagram(240, 290, 0, 40, 2)]
+        labels = [csr.model.Label(100, 140, 108, 118, 1), csr.model.Label(40, 60, 110, 120, 0)]
+
+        labelled_diags = csr.actions.label_diags(labels, diags, fig_bbox, method='assignment')
+
+        # The smallest diagram is left without a label
+        self.assertEqual([(diag.tag, diag.label.tag) for diag in labelled_diags], [(0, 0), (1, 1)])
+
+    def test_merge_all_overlaps_order(self):
+        ''' Tests unmerged panels come first in input order, then merged panels in order of their first member'''
+
+        untouched = csr.model.Panel(300, 310, 300, 310)
+        panels = [csr.model.Panel(0, 10, 0, 10), csr.model.Panel(100, 110, 0, 10), untouched,
+                  csr.model.Panel(5, 15, 5, 15), csr.model.Panel(105, 120, 5, 15),
+                  csr.model.Panel(12, 25, 12, 20)]  # Overlaps the fourth panel only
+        merged, done = csr.actions.merge_all_overlaps(panels)
+
+        # Merging one pair at a time would have put the (100, 120) panel first, as its last merge came earlier
+        self.assertEqual([(panel.left, panel.right, panel.top, panel.bottom) for panel in merged],
+                         [(300, 310, 300, 310), (0, 25, 0, 20), (100, 120, 0, 15)])
+        self.assertIs(merged[0], untouched)
+        self.assertEqual([panel.tag for panel in merged], [0, 1, 2])
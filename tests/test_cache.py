@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+test_cache
+========
+
+Test caching of extraction results.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import chemschematicresolver as csr
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+log = logging.getLogger(__name__)
+
+
+class TestResultCache(unittest.TestCase):
+    """ Tests storage, lookup and eviction of cached results."""
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_round_trip(self):
+        cache = csr.cache.ResultCache(self.cache_dir)
+        key = cache.key(b'image bytes')
+        output = [(['1a', '1b'], 'c1ccccc1'), (['2'], 'CCO')]
+
+        self.assertIsNone(cache.get(key))
+        cache.set(key, output)
+        self.assertEqual(cache.get(key), output)
+
+    def test_negative_result(self):
+        cache = csr.cache.ResultCache(self.cache_dir)
+        key = cache.key(b'image bytes')
+        cache.set(key, [])
+        self.assertEqual(cache.get(key), [])
+
+    def test_key_settings(self):
+        cache = csr.cache.ResultCache(self.cache_dir)
+        self.assertEqual(cache.key(b'image bytes'), cache.key(b'image bytes'))
+        self.assertNotEqual(cache.key(b'image bytes'), cache.key(b'other bytes'))
+        self.assertNotEqual(cache.key(b'image bytes', allow_wildcards=False),
+                            cache.key(b'image bytes', allow_wildcards=True))
+        self.assertNotEqual(cache.key(b'image bytes', dtype='float64'), cache.key(b'image bytes', dtype='uint8'))
+        self.assertEqual(cache.key(b'image bytes', segment_pixel_budget=None), cache.key(b'image bytes'))
+
+    def test_key_dictionaries(self):
+        superatom_path = os.path.join(self.cache_dir, 'superatom.txt')
+        spelling_path = os.path.join(self.cache_dir, 'spelling.txt')
+        for dict_path in [superatom_path, spelling_path]:
+            with open(dict_path, 'w') as outf:
+                outf.write('Me C\n')
+        cache = csr.cache.ResultCache(os.path.join(self.cache_dir, 'entries'), superatom_path=superatom_path,
+                                      spelling_path=spelling_path)
+        key = cache.key(b'image bytes')
+
+        # Dictionaries are only read again once they change
+        with mock.patch.object(csr.cache, 'open', side_effect=AssertionError, create=True):
+            self.assertEqual(cache.key(b'image bytes'), key)
+
+        with open(superatom_path, 'a') as outf:
+            outf.write('Et CC\n')
+        self.assertNotEqual(cache.key(b'image bytes'), key)
+
+    def test_lru_eviction(self):
+        cache = csr.cache.ResultCache(self.cache_dir, max_size=80)
+        keys = [cache.key(str(i).encode('utf-8')) for i in range(3)]
+        output = [(['1'], 'C' * 20)]
+
+        cache.set(keys[0], output)
+        cache.set(keys[1], output)
+        os.utime(os.path.join(self.cache_dir, keys[1] + '.json'), (0, 0))  # Make the second entry least recent
+        cache.set(keys[2], output)
+
+        self.assertLessEqual(cache.size(), 80)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual(cache.get(keys[2]), output)
+
+    def test_evict_removed_entries(self):
+        cache = csr.cache.ResultCache(self.cache_dir, max_size=1000)
+        keys = [cache.key(str(i).encode('utf-8')) for i in range(3)]
+        output = [(['1'], 'C' * 20)]
+        for key in keys:
+            cache.set(key, output)
+
+        # Another process removes an entry after this one has listed them
+        entries = cache._entries()
+        os.remove(os.path.join(self.cache_dir, keys[0] + '.json'))
+        cache.max_size = 40
+        with mock.patch.object(cache, '_entries', return_value=entries):
+            cache.evict()
+
+        self.assertEqual(len(cache._entries()), 1)
+        self.assertLessEqual(cache.size(), 40)
@@ -9,6 +9,12 @@ Test extraction of chemical schematic diagrams
 
 import unittest
 import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock
+
 import chemschematicresolver as csr
 
 tests_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,6 +25,203 @@ img_dir = os.path.join(tests_dir, 'data')
 # train_imgs_dir = os.path.join(train_dir, 'train_imgs')
 
 
+
+# Inputs read by the stand-in extraction functions, in order
+extracted = []
+
+
+def read_input(f):
+    """ Reads the content of an input given as a path or file-like object, failing for inputs containing 'x'"""
+
+    if hasattr(f, 'read'):
+        content = f.read().decode('utf-8')
+    else:
+        with open(f) as inf:
+            content = inf.read()
+    extracted.append(content)
+    if content == 'x':
+        raise ValueError('Unreadable input')
+    return content
+
+
+def fake_extract_image(f, debug=False, allow_wildcards=False, cache=None, timer=None):
+    """ Stands in for extract_image, returning the content of the input as its only label"""
+
+    with timer.stage('read'):
+        content = read_input(f)
+    return [([content], 'C')]
+
+
+def fake_extract_document(f, extract_all=True, allow_wildcards=False, output=None, timer=None):
+    """ Stands in for extract_document, returning the content of the input as its only record, or as the label of
+    its only diagram"""
+
+    content = read_input(f)
+    if extract_all:
+        return [{'labels': [content]}]
+    return [[([content], 'C')]]
+
+
+class TestExtractCorpus(unittest.TestCase):
+    """ Tests extraction from directories and archives of inputs, with extract_image replaced"""
+
+    names = ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg']
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.patchers = [mock.patch.object(csr.extract, 'extract_image', fake_extract_image),
+                         mock.patch.object(csr.extract, 'extract_document', fake_extract_document),
+                         mock.patch.object(csr.extract, 'warmup')]
+        for patcher in self.patchers:
+            patcher.start()
+        del extracted[:]
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        shutil.rmtree(self.tmp_dir)
+
+    def make_dir(self, contents):
+        """ Writes a directory of inputs, one file per item of contents"""
+        dir_path = os.path.join(self.tmp_dir, 'inputs')
+        os.mkdir(dir_path)
+        for i, content in enumerate(contents):
+            with open(os.path.join(dir_path, '%s.jpg' % i), 'w') as outf:
+                outf.write(content)
+        return dir_path
+
+    def make_zip(self, filename='figs.zip'):
+        path = os.path.join(self.tmp_dir, filename)
+        with zipfile.ZipFile(path, 'w') as zip_ref:
+            zip_ref.writestr('subdir/', '')
+            for name in self.names:
+                zip_ref.writestr(name, name[0])
+        return path
+
+    def make_tar(self, filename='figs.tar.gz', mode='w:gz'):
+        src_dir = os.path.join(self.tmp_dir, filename + '_src')
+        os.mkdir(src_dir)
+        path = os.path.join(self.tmp_dir, filename)
+        with tarfile.open(path, mode) as tar_ref:
+            tar_ref.add(src_dir, arcname='subdir', recursive=False)
+            for name in self.names:
+                with open(os.path.join(src_dir, name), 'w') as outf:
+                    outf.write(name[0])
+                tar_ref.add(os.path.join(src_dir, name), arcname=name)
+        return path
+
+    def test_workers(self):
+        for archive in [self.make_zip(), self.make_tar()]:
+            expected = [[([name[0]], 'C')] for name in self.names]
+
+            self.assertEqual(csr.extract.extract_images(archive, workers=2), expected)
+
+            unordered = csr.extract.extract_images(archive, workers=2, ordered=False)
+            self.assertEqual(sorted(unordered), expected)
+
+    def test_init_worker(self):
+        # A worker that cannot load Tesseract still starts, so the pool does not keep replacing it
+        with mock.patch.object(csr.extract, 'threadpool_limits') as limits, \
+                mock.patch.object(csr.extract, 'warmup', side_effect=RuntimeError('no tessdata')):
+            csr.extract.init_worker(2)
+        limits.assert_called_once_with(2)
+
+    def test_get_inputs_archives(self):
+        archives = [self.make_zip(), self.make_tar(), self.make_tar('figs.tgz'), self.make_tar('figs.tar', 'w')]
+
+        for archive in archives:
+            inputs = list(csr.extract.get_inputs(archive))
+
+            # Members are read in memory and named after the archive, skipping directories
+            self.assertEqual([f.name for f in inputs], [os.path.join(archive, name) for name in self.names])
+            self.assertEqual([f.read() for f in inputs], [name[0].encode('utf-8') for name in self.names])
+
+            results = csr.extract.extract_images(archive)
+            self.assertEqual(results, [[([name[0]], 'C')] for name in self.names])
+
+        # Files are only opened as archives by their extension
+        not_archive = os.path.join(self.tmp_dir, 'figs.notzip')
+        os.rename(self.make_zip('other.zip'), not_archive)
+        with self.assertRaises(NotADirectoryError):
+            csr.extract.get_inputs(not_archive)
+
+    def test_iter_extract_images(self):
+        dir_path = self.make_dir(['a', 'x', 'b'])
+        results = csr.extract.iter_extract_images(dir_path)
+
+        # Nothing is extracted until the first result is requested
+        self.assertEqual(extracted, [])
+        first = next(results)
+        self.assertEqual(len(extracted), 1)
+
+        outputs = sorted([first] + list(results), key=lambda output: output[0])
+        self.assertEqual([len(output) for output in outputs], [4, 4, 4])
+
+        path, result, error, timings = outputs[0]
+        self.assertEqual(path, os.path.join(dir_path, '0.jpg'))
+        self.assertEqual(result, [(['a'], 'C')])
+        self.assertIsNone(error)
+        self.assertEqual(set(timings), {'total', 'read'})
+        self.assertEqual(timings['read']['calls'], 1)
+
+        # Errors are yielded rather than raised
+        path, result, error, timings = outputs[1]
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+        self.assertIn('total', timings)
+
+        with self.assertRaises(ValueError):
+            csr.extract.extract_images(dir_path)
+
+    def test_iter_extract_documents(self):
+        dir_path = self.make_dir(['a', 'x'])
+        results = csr.extract.iter_extract_documents(dir_path, extract_all=False)
+
+        self.assertEqual(extracted, [])
+        outputs = [next(results)]
+        self.assertEqual(len(extracted), 1)
+        outputs = sorted(outputs + list(results), key=lambda output: output[0])
+
+        path, result, error, timings = outputs[0]
+        self.assertEqual(result, [[(['a'], 'C')]])
+        self.assertIsNone(error)
+        self.assertIn('total', timings)
+
+        path, result, error, timings = outputs[1]
+        self.assertIsNone(result)
+        self.assertIsInstance(error, ValueError)
+
+    def test_extract_documents_resume(self):
+        dir_path = self.make_dir(['a', 'b'])
+        journal_path = os.path.join(self.tmp_dir, 'journal.jsonl')
+
+        results = csr.extract.extract_documents(dir_path, extract_all=False, journal=journal_path)
+        self.assertEqual(sorted(extracted), ['a', 'b'])
+
+        # Recorded documents are replayed rather than extracted again, with (labels, smiles) pairs restored to tuples
+        del extracted[:]
+        resumed = csr.extract.extract_documents(dir_path, extract_all=False, journal=journal_path)
+        self.assertEqual(extracted, [])
+        self.assertEqual(sorted(resumed, key=str), sorted(results, key=str))
+        self.assertIsInstance(resumed[0][0][0], tuple)
+
+        # Chemical records are already JSON types
+        records_journal_path = os.path.join(self.tmp_dir, 'records_journal.jsonl')
+        results = csr.extract.extract_documents(dir_path, extract_all=True, journal=records_journal_path)
+        resumed = csr.extract.extract_documents(dir_path, extract_all=True, journal=records_journal_path)
+        self.assertEqual(sorted(resumed, key=str), sorted(results, key=str))
+
+        # Resuming with different settings would replay outputs from another configuration
+        with self.assertRaises(ValueError):
+            csr.extract.extract_documents(dir_path, extract_all=True, journal=journal_path)
+
+    def test_limit_threads_environ(self):
+        previous = os.environ.get('OMP_NUM_THREADS')
+        with csr.extract.limit_threads_environ(2):
+            self.assertEqual(os.environ['OMP_NUM_THREADS'], '2')
+        self.assertEqual(os.environ.get('OMP_NUM_THREADS'), previous)
+
+
 class TestExtract(unittest.TestCase):
     """ Tests the overall extraction case"""
 
@@ -43,3 +43,50 @@ class TestImportAndSave(unittest.TestCase):
 
 
 
+
+    def test_import_dtypes(self):
+        """ Tests each image dtype policy gives the same binary image"""
+
+        figs = {dtype: csr.io.imread(sample_diag, dtype=dtype) for dtype in csr.io.DTYPES}
+
+        self.assertEqual(figs['float64'].img.dtype, 'float64')
+        self.assertEqual(figs['float32'].img.dtype, 'float32')
+        self.assertEqual(figs['uint8'].img.dtype, 'uint8')
+        self.assertEqual(figs['uint8'].img.ndim, 2)
+
+        binary = figs['float64'].binary
+        for dtype in ['float32', 'uint8']:
+            differing = (figs[dtype].binary != binary).sum()
+            self.assertLess(differing, binary.size * 0.001)
+
+    def test_import_max_pixels(self):
+        """ Tests large images are downscaled while decoding"""
+
+        fig = csr.io.imread(sample_diag)
+        height, width = fig.img.shape[:2]
+        max_pixels = height * width // 10
+
+        reduced_fig = csr.io.imread(sample_diag, max_pixels=max_pixels)
+        reduced_height, reduced_width = reduced_fig.img.shape[:2]
+        self.assertLessEqual(reduced_height * reduced_width, max_pixels)
+        self.assertGreater(reduced_height * reduced_width, max_pixels * 0.95)
+        self.assertAlmostEqual(reduced_width / reduced_height, width / height, places=1)
+
+        # Images within budget are unchanged
+        self.assertEqual(csr.io.imread(sample_diag, max_pixels=height * width).img.shape, fig.img.shape)
+
+    def test_imsave_temp(self):
+        """ Tests each temporary image gets its own file, which is deleted by imdel"""
+
+        img = csr.io.imread(sample_diag).img
+        paths = [csr.io.imsave_temp(img, 'png', prefix='osra_temp_') for i in range(2)]
+        try:
+            self.assertNotEqual(paths[0], paths[1])
+            for path in paths:
+                self.assertTrue(os.path.basename(path).startswith('osra_temp_'))
+                self.assertTrue(path.endswith('.png'))
+                self.assertEqual(csr.io.imread(path).img.shape, img.shape)
+        finally:
+            for path in paths:
+                csr.io.imdel(path)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+test_journal
+========
+
+Test checkpointing of corpus extractions.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import chemschematicresolver as csr
+import os
+import shutil
+import tempfile
+import unittest
+
+log = logging.getLogger(__name__)
+
+
+class TestJournal(unittest.TestCase):
+    """ Tests recording and resuming from a checkpoint journal."""
+
+    def setUp(self):
+        self.journal_dir = tempfile.mkdtemp()
+        self.journal_path = os.path.join(self.journal_dir, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.journal_dir)
+
+    def test_resume(self):
+        journal = csr.journal.Journal(self.journal_path)
+        journal.record('doc1.html', [{'names': ['benzene'], 'labels': ['1']}])
+        journal.record('doc2.html', [])
+
+        resumed = csr.journal.Journal(self.journal_path)
+        self.assertEqual(len(resumed), 2)
+        self.assertTrue('doc1.html' in resumed)
+        self.assertFalse('doc3.html' in resumed)
+        self.assertEqual(resumed.get('doc1.html'), [{'names': ['benzene'], 'labels': ['1']}])
+        self.assertEqual(resumed.get('doc2.html'), [])
+
+    def test_incomplete_entry(self):
+        journal = csr.journal.Journal(self.journal_path)
+        journal.record('doc1.html', [])
+
+        # Simulate a crash while writing the next entry
+        with open(self.journal_path, 'a') as outf:
+            outf.write('{"path": "doc2.ht')
+
+        resumed = csr.journal.Journal(self.journal_path)
+        self.assertEqual(len(resumed), 1)
+        self.assertTrue('doc1.html' in resumed)
+
+        resumed.record('doc2.html', [])
+        self.assertTrue('doc2.html' in csr.journal.Journal(self.journal_path))
+
+    def test_settings(self):
+        journal = csr.journal.Journal(self.journal_path, {'allow_wildcards': False})
+        journal.record('doc1.html', [])
+
+        self.assertEqual(len(csr.journal.Journal(self.journal_path, {'allow_wildcards': False})), 1)
+        with self.assertRaises(ValueError):
+            csr.journal.Journal(self.journal_path, {'allow_wildcards': True})
+        with self.assertRaises(ValueError):
+            csr.journal.Journal(self.journal_path)
@@ -14,6 +14,7 @@ from __future__ import unicode_literals
 import logging
 
 import chemschematicresolver.model as mod
+import numpy as np
 import unittest
 
 log = logging.getLogger(__name__)
@@ -38,3 +39,85 @@ class TestModel(unittest.TestCase):
         list1 = [tuple1, tuple2]
 
         self.assertTrue(tuple1 in list1)
+
+    def test_figure_cached_images(self):
+        img = np.ones((20, 30, 3))
+        img[5:15, 10:12] = 0
+        fig = mod.Figure(img)
+
+        self.assertEqual(fig.greyscale.shape, (20, 30))
+        self.assertEqual(np.count_nonzero(fig.binary), 20)
+        self.assertTrue(fig.binary is fig.binary)
+        self.assertTrue(np.count_nonzero(fig.skeleton) > 0)
+
+    def test_figure_cache_invalidation(self):
+        fig = mod.Figure(np.ones((20, 30, 3)))
+        self.assertEqual(np.count_nonzero(fig.binary), 0)
+
+        # Assigning a new image clears the cache
+        new_img = np.ones((20, 30, 3))
+        new_img[0:2, 0:2] = 0
+        fig.img = new_img
+        self.assertEqual(np.count_nonzero(fig.binary), 4)
+
+        # In place modifications require explicit invalidation
+        fig.img[10:12, 10:12] = 0
+        fig.invalidate()
+        self.assertEqual(np.count_nonzero(fig.binary), 8)
+
+    def test_figure_view_and_copy(self):
+        img = np.ones((20, 30, 3))
+        fig = mod.Figure(img)
+
+        view = fig.view(5, 15, 0, 10)
+        self.assertEqual(view.img.shape, (10, 10, 3))
+        self.assertTrue(np.shares_memory(view.img, img))
+
+        copied = fig.copy()
+        copied.img[0:2, 0:2] = 0
+        self.assertTrue((img == 1).all())
+
+        # Derived images are shared, so cannot be modified in place
+        with self.assertRaises(ValueError):
+            fig.binary[0, 0] = True
+
+        # OCR results are cleared with the derived images
+        fig.ocr_results['region'] = []
+        fig.invalidate()
+        self.assertEqual(fig.ocr_results, {})
+
+    def test_rect_array(self):
+        rng = np.random.RandomState(0)
+        rects = []
+        for i in range(30):
+            left, top = rng.randint(0, 50, 2)
+            rects.append(mod.Panel(left, left + rng.randint(0, 20), top, top + rng.randint(0, 20), i))
+        others = [mod.Diagram(rect.left + 3, rect.right + 5, rect.top - 2, rect.bottom, 0) for rect in rects[:10]]
+
+        rect_array = mod.RectArray.from_rects(rects)
+        other_array = mod.RectArray.from_rects(others)
+
+        self.assertEqual(len(rect_array), 30)
+        overlaps = rect_array.overlaps(other_array)
+        contains = rect_array.contains(other_array)
+        separation = rect_array.separation(other_array)
+        compass = rect_array.compass(other_array)
+        for i, rect in enumerate(rects):
+            for j, other in enumerate(others):
+                self.assertEqual(overlaps[i, j], rect.overlaps(other))
+                self.assertEqual(contains[i, j], rect.contains(other))
+                self.assertAlmostEqual(separation[i, j], rect.separation(other))
+                diag = mod.Diagram(rect.left, rect.right, rect.top, rect.bottom)
+                self.assertEqual(compass[i, j], diag.compass_position(other))
+
+        # Conversion is lossless
+        converted = rect_array.to_rects()
+        self.assertEqual(converted, rects)
+        self.assertEqual([rect.tag for rect in converted], [rect.tag for rect in rects])
+        self.assertEqual(rect_array[[2, 5]].to_rects(mod.Rect), [rects[2], rects[5]])
+
+    def test_slots(self):
+        label = mod.Label(0, 10, 0, 10, 1)
+        self.assertEqual(label.r_group, [])
+        with self.assertRaises(AttributeError):
+            label.colour = 'red'
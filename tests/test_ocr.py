@@ -11,14 +11,122 @@ import unittest
 import os
 import chemschematicresolver as csr
 import copy
+import numpy
+import threading
+from unittest import mock
 
 from matplotlib import pyplot as plt
 import matplotlib.patches as mpatches
 
+from synthetic import make_schematic
+
 tests_dir = os.path.abspath(__file__)
 test_ocr_dir = os.path.join(os.path.dirname(tests_dir), 'data', 'ocr')
 
 
+class FakeResultIterator(object):
+    """ Stands in for a Tesseract result iterator, walking the text in FakeApi.results.
+
+    Records the levels text is read at, and calls for properties only used by full (not light) results.
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.symbols = [((b, p, l, w, s), char)
+                        for b, block in enumerate(results) for p, para in enumerate(block)
+                        for l, line in enumerate(para) for w, word in enumerate(line) for s, char in enumerate(word)]
+        self.i = 0
+        self.text_levels = set()
+        self.full_calls = []
+
+    def Begin(self):
+        self.i = 0
+
+    def IsAtBeginningOf(self, ril):
+        return not any(self.symbols[self.i][0][ril + 1:])
+
+    def Next(self, ril):
+        prefix = self.symbols[self.i][0][:ril + 1]
+        while self.i + 1 < len(self.symbols):
+            self.i += 1
+            if self.symbols[self.i][0][:ril + 1] != prefix:
+                return True
+        return False
+
+    def GetUTF8Text(self, ril):
+        self.text_levels.add(ril)
+        element = self.results
+        for index in self.symbols[self.i][0][:ril + 1]:
+            element = element[index]
+        if ril >= csr.ocr.RIL.WORD:
+            return element
+        if ril == csr.ocr.RIL.TEXTLINE:
+            return ' '.join(element)
+        return '\n'.join(' '.join(line) for para in ([element] if ril == csr.ocr.RIL.PARA else element)
+                         for line in para)
+
+    def BoundingBox(self, ril, padding=0):
+        return self.i - padding, -padding, self.i + 1 + padding, 1 + padding
+
+    def Confidence(self, ril):
+        return 90.0
+
+    def _full(name, value):
+        def method(self):
+            self.full_calls.append(name)
+            return value
+        return method
+
+    Orientation = _full('Orientation', (0, 0, 0, 0.0))
+    ParagraphInfo = _full('ParagraphInfo', (0, False, False, 0))
+    ParagraphIsLtr = _full('ParagraphIsLtr', True)
+    WordFontAttributes = _full('WordFontAttributes', None)
+    WordRecognitionLanguage = _full('WordRecognitionLanguage', 'eng')
+    WordIsFromDictionary = _full('WordIsFromDictionary', False)
+    WordIsNumeric = _full('WordIsNumeric', False)
+    SymbolIsDropcap = _full('SymbolIsDropcap', False)
+    SymbolIsSubscript = _full('SymbolIsSubscript', False)
+    SymbolIsSuperscript = _full('SymbolIsSuperscript', False)
+    del _full
+
+
+class FakeApi(object):
+    """ Stands in for tesserocr.PyTessBaseAPI, recording how it is set up and used"""
+
+    #: Text recognized in every image, as blocks of paragraphs of lines of words
+    results = [[[['1a', 'R'], ['2']]], [[['3b']]]]
+
+    def __init__(self, psm=csr.ocr.PSM.AUTO):
+        self.psm = psm
+        self.variables = {}
+        self.image = None
+        self.rectangle = None
+        self.iterator = None
+        self.recognized = 0
+
+    def SetImage(self, pil_img):
+        self.image = pil_img.size
+
+    def Recognize(self):
+        self.recognized += 1
+        self.iterator = FakeResultIterator(self.results)
+
+    def GetIterator(self):
+        return self.iterator
+
+    def SetVariable(self, name, value):
+        self.variables[name] = value
+
+    def SetImageBytes(self, data, width, height, bytes_per_pixel, bytes_per_line):
+        self.image = (width, height)
+
+    def SetRectangle(self, left, top, width, height):
+        self.rectangle = (left, top, width, height)
+
+    def Clear(self):
+        self.image = self.rectangle = None
+
+
 class TestOcr(unittest.TestCase):
 
     def test_ocr_all_imgs(self):
@@ -37,6 +145,92 @@ class TestOcr(unittest.TestCase):
 
         self.assert_equal(text_blocks[0].text, '1: R1=R2=H:TQEN\n2:R1=H,R2=OMe:T(MQ)EN\n3: R1=R2=OMe:T(TMQ)EN\n\n')
 
+    def test_get_api_pool(self):
+        """
+        Tests Tesseract APIs are reused for the same settings, and kept separately by each thread"""
+
+        api = csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST)
+        self.assertIs(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST), api)
+        self.assertIsNot(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK), api)
+
+        thread_apis = []
+        thread = threading.Thread(target=lambda: thread_apis.append(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK,
+                                                                                     csr.ocr.LABEL_WHITELIST)))
+        thread.start()
+        thread.join()
+        self.assertIsNot(thread_apis[0], api)
+
+    def test_ocr_session(self):
+        """
+        Tests labels read in a session give the same text as reading each label separately, in figure coordinates"""
+
+        fig, diags, labels = make_schematic(n_panels=3, label_height=30)
+
+        with csr.ocr.OcrSession(fig) as session:
+            for label in labels:
+                session_text = session.get_text(label)
+                cropped_img = csr.utils.crop(fig.greyscale, label.left, label.right, label.top, label.bottom)
+                text = csr.ocr.get_text(csr.utils.pad_white(cropped_img, 5), psm=csr.ocr.PSM.SINGLE_BLOCK,
+                                        whitelist=csr.ocr.LABEL_WHITELIST)
+
+                self.assertEqual(csr.ocr.get_sentences(session_text), csr.ocr.get_sentences(text))
+                line = session_text[0][0][0]
+                self.assertTrue(label.left - 5 <= line.left < line.right <= label.right + 5)
+                self.assertTrue(label.top - 5 <= line.top < line.bottom <= label.bottom + 5)
+
+    def test_ocr_session_nesting(self):
+        """
+        Tests a second session cannot be opened in the same thread until the first is closed"""
+
+        fig, diags, labels = make_schematic(n_panels=1, label_height=30)
+
+        with csr.ocr.OcrSession(fig):
+            with self.assertRaises(RuntimeError):
+                csr.ocr.OcrSession(fig)
+
+        with csr.ocr.OcrSession(fig) as session:
+            self.assertTrue(session.get_text(labels[0]))
+
+    def test_get_text_level(self):
+        """
+        Tests stopping at the line or word level gives the same text, without reading deeper elements"""
+
+        fig, diags, labels = make_schematic(n_panels=1, label_height=30)
+        label = labels[0]
+        img = csr.utils.pad_white(csr.utils.crop(fig.greyscale, label.left, label.right, label.top, label.bottom), 5)
+
+        full = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK)
+        lines = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK, level=csr.ocr.RIL.TEXTLINE, light=True)
+        words = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK, level=csr.ocr.RIL.WORD)
+
+        self.assertEqual(csr.ocr.get_sentences(lines), csr.ocr.get_sentences(full))
+        self.assertEqual([block.confidence for block in lines], [block.confidence for block in full])
+        self.assertTrue(all(len(line) == 0 for line in csr.ocr.get_lines(lines)))
+        self.assertIsNone(lines[0].orientation)
+        self.assertEqual([word.text for word in csr.ocr.get_words(words)],
+                         [word.text for word in csr.ocr.get_words(full)])
+        self.assertTrue(all(len(word) == 0 for word in csr.ocr.get_words(words)))
+
+    def test_read_region_memo(self):
+        """
+        Tests each region is recognized once per figure, and kept apart from reads of it in a session"""
+
+        fig, diags, rects = make_schematic(n_panels=2, label_height=30)
+        labels = [csr.model.Label(rect.left, rect.right, rect.top, rect.bottom, i) for i, rect in enumerate(rects)]
+
+        csr.ocr.read_label(fig, labels[0])
+        self.assertEqual(len(fig.ocr_results), 1)
+        text = list(fig.ocr_results.values())[0]
+        self.assertIs(csr.ocr.read_region(fig, labels[0], level=csr.ocr.RIL.TEXTLINE, light=True, size=5), text)
+
+        with csr.ocr.OcrSession(fig) as session:
+            session_text = csr.ocr.read_region(fig, labels[0], level=csr.ocr.RIL.TEXTLINE, light=True, session=session)
+            self.assertIsNot(session_text, text)
+            csr.ocr.read_label(fig, labels[0], session=session)
+            csr.ocr.read_label(fig, labels[1], session=session)
+        self.assertEqual(len(fig.ocr_results), 3)
+        self.assertTrue(all(label.text for label in labels))
+
     def test_ocr_r_group(self):
         """
         Used to test different functions on OCR recognition"""
@@ -61,3 +255,116 @@ class TestOcr(unittest.TestCase):
 
 
 
+
+
+class TestOcrFakeApi(unittest.TestCase):
+    """ Tests the handling of Tesseract APIs and results, with the API replaced so no trained data is needed"""
+
+    def setUp(self):
+        self.patchers = [mock.patch.object(csr.ocr.tesserocr, 'PyTessBaseAPI', FakeApi),
+                         mock.patch.object(csr.ocr, '_api_pool', threading.local())]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def test_get_api_pool(self):
+        api = csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST)
+        self.assertEqual(api.psm, csr.ocr.PSM.SINGLE_BLOCK)
+        self.assertEqual(api.variables, {'tessedit_char_whitelist': csr.ocr.LABEL_WHITELIST})
+
+        # One API for each combination of settings and slot
+        self.assertIs(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST), api)
+        self.assertIsNot(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK), api)
+        self.assertIsNot(csr.ocr.get_api(csr.ocr.PSM.SINGLE_LINE, csr.ocr.LABEL_WHITELIST), api)
+        self.assertIsNot(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST, slot='session'), api)
+        self.assertEqual(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK).variables, {})
+
+        # And one pool for each thread
+        thread_apis = []
+        thread = threading.Thread(target=lambda: thread_apis.append(csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK,
+                                                                                     csr.ocr.LABEL_WHITELIST)))
+        thread.start()
+        thread.join()
+        self.assertIsInstance(thread_apis[0], FakeApi)
+        self.assertIsNot(thread_apis[0], api)
+
+    def test_ocr_session(self):
+        fig = csr.model.Figure(numpy.ones((50, 80)))
+
+        with mock.patch.object(csr.ocr, 'recognize', return_value=[]) as recognize:
+            with csr.ocr.OcrSession(fig, margin=5) as session:
+                self.assertEqual(session.api.image, (80, 50))
+
+                # Regions are widened by the margin, clipped to the figure
+                session.get_text(csr.model.Rect(10, 20, 30, 40))
+                self.assertEqual(session.api.rectangle, (5, 25, 20, 20))
+                session.get_text(csr.model.Rect(0, 78, 2, 50))
+                self.assertEqual(session.api.rectangle, (0, 0, 80, 50))
+                self.assertEqual(recognize.call_count, 2)
+
+                # Only one session can use the pooled API at a time
+                with self.assertRaises(RuntimeError):
+                    csr.ocr.OcrSession(fig)
+                self.assertEqual(session.api.image, (80, 50))
+
+        self.assertIsNone(session.api.image)
+        with csr.ocr.OcrSession(fig) as new_session:
+            self.assertIs(new_session.api, session.api)
+
+    def test_get_text_level(self):
+        img = numpy.ones((20, 40))
+        api = csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK)
+
+        full = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK)
+        self.assertEqual(csr.ocr.get_sentences(full), ['1a R', '2', '3b'])
+        self.assertEqual([symbol.text for word in csr.ocr.get_words(full) for symbol in word], list('1aR23b'))
+        self.assertTrue(api.iterator.full_calls)
+        self.assertEqual(full[0].orientation, csr.ocr.Orientation.PAGE_UP)
+
+        # Stopping at the line level gives the same lines, without reading words or full properties
+        lines = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK, level=csr.ocr.RIL.TEXTLINE, light=True)
+        self.assertEqual(csr.ocr.get_sentences(lines), csr.ocr.get_sentences(full))
+        self.assertEqual([block.text for block in lines], [block.text for block in full])
+        self.assertTrue(all(len(line) == 0 for line in csr.ocr.get_lines(lines)))
+        self.assertEqual(max(api.iterator.text_levels), csr.ocr.RIL.TEXTLINE)
+        self.assertEqual(api.iterator.full_calls, [])
+        self.assertIsNone(lines[0].orientation)
+
+        # Stopping at the word level gives the same words, without reading symbols
+        words = csr.ocr.get_text(img, psm=csr.ocr.PSM.SINGLE_BLOCK, level=csr.ocr.RIL.WORD, light=True)
+        self.assertEqual([word.text for word in csr.ocr.get_words(words)], ['1a', 'R', '2', '3b'])
+        self.assertTrue(all(len(word) == 0 for word in csr.ocr.get_words(words)))
+        self.assertEqual(max(api.iterator.text_levels), csr.ocr.RIL.WORD)
+        self.assertEqual(api.iterator.full_calls, [])
+
+        # The padding added around the image is removed from the coordinates
+        self.assertEqual(full[0].left, -3)
+        self.assertIsNone(api.image)
+
+    def test_read_region_memo(self):
+        fig = csr.model.Figure(numpy.ones((50, 80)))
+        label = csr.model.Label(10, 30, 10, 20, 0)
+        crop_api = csr.ocr.get_api(csr.ocr.PSM.SINGLE_BLOCK, csr.ocr.LABEL_WHITELIST)
+
+        crop_text = csr.ocr.read_region(fig, label, level=csr.ocr.RIL.TEXTLINE, light=True, size=5)
+        self.assertIs(csr.ocr.read_region(fig, label, level=csr.ocr.RIL.TEXTLINE, light=True, size=5), crop_text)
+        self.assertEqual(crop_api.recognized, 1)
+        self.assertEqual([key[-1] for key in fig.ocr_results], [('crop', 5)])
+
+        # Reads in a session are stored apart from reads of the padded crop, and recognized once too
+        with csr.ocr.OcrSession(fig, margin=5) as session:
+            session_text = csr.ocr.read_region(fig, label, level=csr.ocr.RIL.TEXTLINE, light=True, session=session)
+            self.assertIsNot(session_text, crop_text)
+            label, conf = csr.ocr.read_label(fig, label, session=session)
+            self.assertEqual(session.api.recognized, 1)
+        self.assertEqual(crop_api.recognized, 1)
+        self.assertEqual(sorted(key[-1] for key in fig.ocr_results), [('crop', 5), ('session', 5)])
+        self.assertTrue(label.text)
+
+        # A crop with a different border is another region to Tesseract
+        csr.ocr.read_region(fig, label, level=csr.ocr.RIL.TEXTLINE, light=True)
+        self.assertEqual(crop_api.recognized, 2)
+        self.assertEqual(len(fig.ocr_results), 3)
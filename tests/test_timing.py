@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+test_timing
+========
+
+Test instrumentation of extraction stages.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import chemschematicresolver as csr
+import unittest
+
+log = logging.getLogger(__name__)
+
+
+class TestStageTimer(unittest.TestCase):
+
+    def test_stage_accumulation(self):
+        timer = csr.timing.StageTimer()
+        for i in range(3):
+            with timer.stage('read_label'):
+                sum(range(1000))
+        with timer.stage('segment'):
+            pass
+
+        self.assertEqual(list(timer.timings.keys()), ['read_label', 'segment'])
+        self.assertEqual(timer.timings['read_label']['calls'], 3)
+        self.assertGreaterEqual(timer.timings['read_label']['wall'], 0.)
+        self.assertGreaterEqual(timer.timings['read_label']['cpu'], 0.)
+
+    def test_callback(self):
+        finished = []
+        timer = csr.timing.StageTimer(callback=lambda stage, wall, cpu: finished.append(stage))
+        with timer.stage('osra'):
+            pass
+        self.assertEqual(finished, ['osra'])
+
+    def test_stage_timed_on_error(self):
+        timer = csr.timing.StageTimer()
+        with self.assertRaises(ValueError):
+            with timer.stage('segment'):
+                raise ValueError
+        self.assertEqual(timer.timings['segment']['calls'], 1)
+
+    def test_null_timer(self):
+        with csr.timing.NULL_TIMER.stage('segment'):
+            pass
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+test_utils
+========
+
+Test image processing utilities.
+
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+import logging
+
+import chemschematicresolver as csr
+import numpy as np
+import unittest
+
+log = logging.getLogger(__name__)
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_region_sum(self):
+        """ Tests region sums from a summed-area table match counting pixels of the cropped image"""
+
+        rng = np.random.RandomState(0)
+        img = rng.rand(50, 80) > 0.7
+        sat = csr.utils.summed_area_table(img)
+
+        for left, right, top, bottom in [(0, 80, 0, 50), (10, 20, 5, 45), (70, 100, 40, 60), (3, 4, 7, 8)]:
+            cropped = csr.utils.crop(img, left, right, top, bottom)
+            ones, all_pixels = csr.utils.region_sum(sat, left, right, top, bottom)
+            self.assertEqual(ones, np.count_nonzero(cropped))
+            self.assertEqual(all_pixels, np.size(cropped))
+
+    def test_region_sum_outside_image(self):
+        sat = csr.utils.summed_area_table(np.ones((10, 10), dtype=bool))
+        self.assertEqual(csr.utils.region_sum(sat, 20, 30, 0, 10), (0, 0))
+
+    def test_binary_closing_edt(self):
+        """ Tests closing by distance transform is pixel-identical to closing by disk structuring element"""
+
+        rng = np.random.RandomState(0)
+        for density in [0.5, 0.05, 0.005]:
+            img = rng.rand(60, 90) > 1 - density
+            for size in [1, 4, 6, 10, 15]:
+                edt_fig = csr.utils.binary_close(csr.model.Figure(img), size=size, method='edt')
+                disk_fig = csr.utils.binary_close(csr.model.Figure(img), size=size, method='disk')
+                self.assertTrue((edt_fig.img == disk_fig.img).all())
+
+    def test_pad_white(self):
+        for img in [np.zeros((4, 5, 3)), np.zeros((4, 5), dtype=np.uint8), np.zeros((4, 5), dtype=np.float32)]:
+            padded = csr.utils.pad_white(img, 2)
+            self.assertEqual(padded.shape[:2], (8, 9))
+            self.assertEqual(padded.dtype, img.dtype)
+            self.assertEqual(padded[0, 0].min(), csr.utils.white(img))
+            self.assertEqual(padded[2:6, 2:7].max(), 0)